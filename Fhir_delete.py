@@ -1,21 +1,19 @@
-import requests
+from fhir_client import FHIRClient
+from fhir_sync import bulk_delete
 
 # 1. Fhir서버에 삭제할 환자 ID 목록
 target_ids = [1, 2 ]  # 여기에 삭제할 환자 ID들을 넣으세요
-FHIR_SERVER_URL = ""
+FHIR_SERVER_URL = ""  # FHIR 서버 기본 주소 (/Patient 제외)
 
-for pid in target_ids:
-
-    url = f"{FHIR_SERVER_URL}/{pid}"
-    response = requests.delete(url)
-    
-    # 200(성공) 또는 204(삭제됨/내용없음)면 성공
-    if response.status_code in [200, 204]:
-        print(f"✅ ID {pid} 삭제 완료!")
-    elif response.status_code == 404:
-        print(f"⚠️ ID {pid}는 이미 없거나 찾을 수 없습니다.")
-    else:
-        print(f"❌ ID {pid} 삭제 실패 (에러코드: {response.status_code})")
+# [최적화] 1명씩 새 연결로 지우지 않고 batch Bundle(미지원 시 작업자 풀)로 한 번에 삭제합니다.
+# ID가 많으면 python fhir_sync.py delete --ids-file ids.txt 를 사용하세요.
+result = bulk_delete(FHIRClient(base_url=FHIR_SERVER_URL), [str(pid) for pid in target_ids])
 
+for pid in result["deleted"]:
+    print(f"✅ ID {pid} 삭제 완료!")
+for pid in result["missing"]:
+    print(f"⚠️ ID {pid}는 이미 없거나 찾을 수 없습니다.")
+for pid in result["failed"]:
+    print(f"❌ ID {pid} 삭제 실패")
 
 print("끝! ✨")
@@ -0,0 +1,541 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import requests
+from werkzeug.serving import make_server, WSGIRequestHandler
+import config
+
+# ==================================================================
+# [성능 측정] 오프라인 벤치마크 (식별 지연시간 / 학습 규모별 시간·메모리 / 동시 처리량)
+# 임시 폴더에 합성 얼굴 이미지를 만들고, MySQL 대신 SQLite, FHIR 서버 대신 fhir_stub.py를 띄워
+# 실제 서버 코드(face_recognizer, routes)를 그대로 측정합니다. 결과는 JSON으로 저장합니다.
+#   identify    : 단계별(decode / detect / predict) p50/p95/p99, 얼굴 검출률, top-1 정확도
+#   endpoint    : HTTP /identify_face, /check_patient_id 지연시간 (순차 요청)
+#   concurrency : 동시 클라이언트 수별 초당 요청 수와 지연시간
+#   training    : 환자 수(N)별 전체 학습 / 증분 학습 시간과 최대 메모리(RSS), N마다 별도 프로세스에서 측정
+#
+# 사용법:
+#   python bench.py --output bench.json
+#   python bench.py --patients 100 --images 10 --train-sizes 50,100,200 --clients 1,4,8
+#   python bench.py --compare old.json --output new.json     (버전 간 주요 수치 비교)
+# ==================================================================
+# 설정 중 임시 폴더로 옮길 경로들
+_PATH_SETTINGS = ('FACES_DIR', 'FACE_INDEX_FILE', 'FACE_PACK_DIR', 'MODEL_FILE', 'MODEL_BIN_FILE',
+                  'MODEL_STATE_FILE', 'FEATURE_CACHE_DIR', 'FHIR_OUTBOX_FILE')
+FRAME_SIZE = (640, 480)
+
+def _log(msg):
+    # 진행 상황은 stderr로 (stdout은 서버 모듈 로그를 끄는 데 사용)
+    print(msg, file=sys.stderr, flush=True)
+
+# ---------------- 합성 얼굴 ----------------
+def synthetic_face(pid, shot, size):
+    """환자마다 생김새(윤곽/눈/코/입 위치와 크기, 피부 결)가 고정되고 촬영마다 위치/밝기/잡음이 다른 얼굴."""
+    ident = np.random.default_rng(pid)
+    rng = np.random.default_rng((pid << 16) + shot)
+    p = ident.uniform(.2, .8, 10)
+    c = size // 2
+    skin = int(150 + 50 * p[1])
+    img = np.full((size, size), int(190 + 40 * p[0]), np.uint8)
+    cv2.ellipse(img, (c, c), (int(size * (.34 + .06 * p[2])), int(size * .46)), 0, 0, 360, skin, -1)
+    texture = cv2.resize(ident.integers(0, 16, (6, 6)).astype(np.float32), (size, size),
+                         interpolation=cv2.INTER_CUBIC)
+    mask = img == skin
+    img = img.astype(np.float32)
+    img[mask] += texture[mask] - 8
+
+    eye_dx = int(size * (.14 + .06 * p[3]))
+    eye_y = c - int(size * (.05 + .06 * p[4]))
+    for side in (-1, 1):
+        ex = c + side * eye_dx
+        cv2.ellipse(img, (ex, eye_y - int(size * .09)), (int(size * .1), int(size * (.015 + .02 * p[5]))),
+                    side * 8 * (p[6] - .5), 0, 360, 60, -1)
+        cv2.ellipse(img, (ex, eye_y), (int(size * (.06 + .03 * p[7])), int(size * .04)), 0, 0, 360, 40, -1)
+    cv2.ellipse(img, (c, c + int(size * .08)), (int(size * .04), int(size * (.05 + .05 * p[8]))), 0, 0, 360, 140, -1)
+    cv2.ellipse(img, (c, c + int(size * .25)), (int(size * (.1 + .08 * p[9])), int(size * .04)), 0, 0, 360, 70, -1)
+    # 점(주근깨/점): 환자마다 위치가 고정된 작은 무늬 (LBPH가 구분할 수 있는 국소 특징)
+    for dx, dy in ident.uniform(-.28, .28, (16, 2)):
+        cv2.circle(img, (c + int(size * dx), c + int(size * dy * 1.3)), max(1, int(size * .015)), skin - 45, -1)
+
+    m = cv2.getRotationMatrix2D((c + rng.uniform(-3, 3), c + rng.uniform(-3, 3)),
+                                rng.uniform(-3, 3), rng.uniform(.97, 1.03))
+    img = cv2.warpAffine(img, m, (size, size), borderMode=cv2.BORDER_REPLICATE)
+    img = cv2.GaussianBlur(img, (5, 5), 0) * rng.uniform(.85, 1.15) + rng.normal(0, 2, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def synthetic_frame(pid, shot, width=FRAME_SIZE[0], height=FRAME_SIZE[1]):
+    """카메라 프레임처럼 배경 위 임의 위치에 얼굴을 그린 JPEG 바이트를 반환합니다."""
+    rng = np.random.default_rng((pid << 16) + shot + 7)
+    frame = cv2.resize(rng.integers(60, 200, (height // 40, width // 40)).astype(np.uint8), (width, height))
+    face = synthetic_face(pid, shot, int(height * .45))
+    size = face.shape[0]
+    x, y = int(rng.integers(0, width - size)), int(rng.integers(0, height - size))
+    frame[y:y + size, x:x + size] = face
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+# ---------------- MySQL 대역 (SQLite) ----------------
+class _SQLiteCursor:
+    """mysql.connector 커서처럼 %s 자리표시자, dictionary 행, rowcount를 지원합니다."""
+    def __init__(self, conn, dictionary):
+        self._cursor = conn.cursor()
+        self._dictionary = dictionary
+        self.rowcount = 0
+
+    @staticmethod
+    def _sql(sql):
+        # MySQL UPSERT 문법을 SQLite 문법으로 바꿈
+        sql = sql.replace('%s', '?').replace('ON DUPLICATE KEY UPDATE', 'ON CONFLICT(id) DO UPDATE SET')
+        return sql.replace('VALUES(last_updated)', 'excluded.last_updated')
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(self._sql(sql), tuple(params))
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, sql, seq):
+        self._cursor.executemany(self._sql(sql), [tuple(p) for p in seq])
+        self.rowcount = self._cursor.rowcount
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((d[0] for d in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+class _SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+
+    def cursor(self, dictionary=False):
+        return _SQLiteCursor(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self._conn.close()
+
+class SQLiteStandIn:
+    """patients 테이블만 가진 로컬 DB. db_manager.get_db_connection 대신 사용합니다."""
+    def __init__(self, path):
+        self.path = path
+        sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(' '))
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS patients "
+                     "(id INTEGER PRIMARY KEY, last_updated TEXT, model_label INTEGER)")
+        conn.commit()
+        conn.close()
+
+    def get_db_connection(self):
+        conn = _SQLiteConnection(self.path)
+        return conn, conn.cursor(dictionary=True)
+
+# ---------------- 측정 환경 ----------------
+class _QuietRequestHandler(WSGIRequestHandler):
+    """요청마다 찍히는 접속 로그를 끈 개발 서버 핸들러"""
+    def log_request(self, *args, **kwargs):
+        pass
+
+def prepare_environment(workdir, fhir_url=None):
+    """설정 경로를 workdir 아래로 옮기고 DB를 SQLite 대역으로 바꿉니다.
+
+    config 값을 import 시점에 읽는 모듈이 많으므로 서버 모듈을 import 하기 전에 호출해야 합니다.
+    """
+    for name in _PATH_SETTINGS:
+        setattr(config, name, os.path.join(workdir, os.path.relpath(getattr(config, name), config.BASE_DIR)))
+    if fhir_url:
+        config.FHIR_SERVER_URL = fhir_url
+    os.makedirs(config.FACES_DIR, exist_ok=True)
+
+    import db_manager
+    db = SQLiteStandIn(os.path.join(workdir, 'patients.sqlite3'))
+    db_manager.get_db_connection = db.get_db_connection
+    return db
+
+def start_fhir_stub(patients):
+    """fhir_stub 서버를 백그라운드 스레드로 띄우고 주소를 반환합니다. 환자 ID는 1..patients."""
+    from http.server import ThreadingHTTPServer
+    import fhir_stub
+    for i in range(patients):
+        fhir_stub.store.create({"name": [{"use": "official", "family": f"Bench{i + 1}", "given": ["NFN"]}]})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), fhir_stub.FHIRStubHandler)
+    threading.Thread(target=server.serve_forever, name="bench-fhir", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """서버 모듈의 print 로그를 잠시 끕니다. (로그 출력 시간이 측정값에 섞이지 않도록)"""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def build_dataset(dataset_dir, patients, images):
+    """환자마다 합성 프레임에서 실제 검출기로 얼굴을 잘라 images장씩 저장합니다. (이미 있으면 재사용)"""
+    from face_recognizer import detect_and_crop_face
+    os.makedirs(dataset_dir, exist_ok=True)
+    started = time.perf_counter()
+    created = 0
+    for pid in range(1, patients + 1):
+        for k in range(images):
+            path = os.path.join(dataset_dir, f"{pid}_{k}.jpg")
+            if os.path.exists(path):
+                continue
+            # 얼굴이 검출되지 않은 프레임은 다른 촬영으로 다시 시도
+            for shot in range(k * 10, k * 10 + 10):
+                face, _ = detect_and_crop_face(synthetic_frame(pid, shot))
+                if face is not None:
+                    cv2.imencode('.jpg', face)[1].tofile(path)
+                    created += 1
+                    break
+    return {"patients": patients, "images_per_patient": images, "created": created,
+            "seconds": round(time.perf_counter() - started, 2)}
+
+def load_patients(db, dataset_dir, patients, images):
+    """데이터셋의 앞쪽 환자들을 patients 테이블과 얼굴 이미지 저장소에 등록합니다."""
+    from face_store import get_face_index
+    face_index = get_face_index()
+    now = datetime.datetime.now()
+    conn, cursor = db.get_db_connection()
+    cursor.executemany("INSERT INTO patients (id, last_updated) VALUES (%s, %s) "
+                       "ON DUPLICATE KEY UPDATE last_updated = VALUES(last_updated)",
+                       [(pid, now) for pid in range(1, patients + 1)])
+    conn.commit()
+    conn.close()
+    total = 0
+    for pid in range(1, patients + 1):
+        for k in range(images):
+            src = os.path.join(dataset_dir, f"{pid}_{k}.jpg")
+            if not os.path.exists(src):
+                continue
+            with open(src, 'rb') as f:
+                face_index.store_image(pid, f.read())
+            total += 1
+    return total
+
+# ---------------- 통계 ----------------
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {"count": 0}
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"count": len(arr), "mean": round(float(arr.mean()), 3), "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3), "p99": round(float(p99), 3), "max": round(float(arr.max()), 3)}
+
+def _elapsed_ms(started):
+    return (time.perf_counter() - started) * 1000
+
+def _peak_rss_mb():
+    """이 프로세스의 최대 메모리 사용량(MB)을 반환합니다. 측정할 수 없으면 None."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        # Windows: GetProcessMemoryInfo의 PeakWorkingSetSize
+        import ctypes
+        from ctypes import wintypes
+
+        class _MemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = _MemoryCounters(cb=ctypes.sizeof(_MemoryCounters))
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+    except (AttributeError, OSError):
+        return None
+
+# ---------------- 식별 ----------------
+def make_probes(patients, images, count):
+    """학습에 쓰지 않은 촬영 번호로 (환자 ID, JPEG) 프레임을 만듭니다."""
+    return [(pid, synthetic_frame(pid, 50000 + i)) for i, pid in
+            ((i, 1 + i % patients) for i in range(count))]
+
+def bench_stages(probes):
+    """identify_image와 같은 순서로 decode / detect / predict 단계 시간을 따로 잽니다."""
+    import face_recognizer
+    decode, detect, predict, total = [], [], [], []
+    found = identified = correct = top1 = 0
+    for pid, data in probes:
+        started = time.perf_counter()
+        t = time.perf_counter()
+        img = face_recognizer.decode_image(data)
+        decode.append(_elapsed_ms(t))
+        t = time.perf_counter()
+        box = face_recognizer.detect_face_box(img)
+        detect.append(_elapsed_ms(t))
+        if box is not None:
+            x, y, w, h = box
+            t = time.perf_counter()
+            identified_id, _, candidates = face_recognizer.recognize_face_topk(img[y:y + h, x:x + w])
+            predict.append(_elapsed_ms(t))
+            found += 1
+            identified += identified_id is not None
+            correct += str(identified_id) == str(pid)
+            top1 += bool(candidates) and str(candidates[0]["patient_id"]) == str(pid)
+        total.append(_elapsed_ms(started))
+    return {"stages": {"decode": percentiles(decode), "detect": percentiles(detect),
+                       "predict": percentiles(predict), "total": percentiles(total)},
+            "face_found_rate": round(found / len(probes), 3) if probes else None,
+            # 얼굴이 검출된 프레임 기준: 1순위 후보 정답률 / 임계값 통과 비율 / 통과한 것 중 정답률
+            "top1_accuracy": round(top1 / found, 3) if found else None,
+            "identified_rate": round(identified / found, 3) if found else None,
+            "identified_precision": round(correct / identified, 3) if identified else None}
+
+def _post_frame(session, base_url, data):
+    started = time.perf_counter()
+    r = session.post(f"{base_url}/identify_face", data=data, headers={"Content-Type": "image/jpeg"}, timeout=30)
+    ok = r.status_code == 200 and r.json().get("status") != "error"
+    return _elapsed_ms(started), ok
+
+def bench_endpoints(base_url, probes, patients):
+    """HTTP 요청 1개씩 순서대로 보내 /identify_face, /check_patient_id 지연시간을 잽니다."""
+    session = requests.Session()
+    identify, errors = [], 0
+    for _, data in probes:
+        ms, ok = _post_frame(session, base_url, data)
+        identify.append(ms)
+        errors += not ok
+    check = []
+    for pid in range(1, min(patients, len(probes)) + 1):
+        started = time.perf_counter()
+        session.post(f"{base_url}/check_patient_id", json={"patient_id": str(pid)}, timeout=30)
+        check.append(_elapsed_ms(started))
+    return {"identify_face": dict(percentiles(identify), errors=errors),
+            "check_patient_id": percentiles(check)}
+
+def bench_concurrency(base_url, probes, clients, total_requests):
+    """동시 클라이언트 수를 바꿔 가며 /identify_face 처리량(초당 요청 수)을 잽니다."""
+    results = []
+    local = threading.local()
+
+    def call(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return _post_frame(local.session, base_url, probes[i % len(probes)][1])
+
+    for count in clients:
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            list(pool.map(call, range(count)))     # 연결 준비 (측정 제외)
+            started = time.perf_counter()
+            samples = list(pool.map(call, range(total_requests)))
+            elapsed = time.perf_counter() - started
+        results.append({"clients": count, "requests": total_requests, "seconds": round(elapsed, 3),
+                        "requests_per_sec": round(total_requests / elapsed, 2),
+                        "errors": sum(1 for _, ok in samples if not ok),
+                        "latency_ms": percentiles([ms for ms, _ in samples])})
+        _log(f"   동시 {count}: {results[-1]['requests_per_sec']} req/s")
+    return results
+
+# ---------------- 학습 ----------------
+def train_child(args):
+    """(별도 프로세스) 환자 N명을 등록하고 전체 학습 / 증분 학습 시간과 최대 메모리를 잽니다."""
+    db = prepare_environment(args.workdir)
+    with quiet(not args.verbose):
+        import face_recognizer
+        images = load_patients(db, args.dataset, args.train_child, args.images)
+        rss_before = _peak_rss_mb()
+        started = time.perf_counter()
+        ok, msg = face_recognizer.train_model_process(full_rebuild=True)
+        train_seconds = time.perf_counter() - started
+        peak_rss = _peak_rss_mb()
+
+        # 증분 학습: 환자 10%에게 이미지 1장씩 추가 (데이터셋의 다른 환자 이미지를 재사용)
+        from face_store import get_face_index
+        face_index = get_face_index()
+        added = 0
+        for pid in range(1, args.train_child + 1, 10):
+            src = os.path.join(args.dataset, f"{pid}_0.jpg")
+            if os.path.exists(src):
+                with open(src, 'rb') as f:
+                    face_index.store_image(pid, f.read())
+                added += 1
+        started = time.perf_counter()
+        face_recognizer.train_model_process()
+        incremental_seconds = time.perf_counter() - started
+
+    result = {"patients": args.train_child, "images": images, "ok": ok, "message": msg,
+              "train_seconds": round(train_seconds, 3), "images_per_sec": round(images / train_seconds, 1),
+              "incremental_images": added, "incremental_seconds": round(incremental_seconds, 3),
+              "rss_before_train_mb": rss_before, "peak_rss_mb": peak_rss}
+    with open(args.result, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+    return 0
+
+def bench_training(sizes, images, dataset_dir, workdir, verbose):
+    """환자 수마다 새 프로세스를 띄워 학습을 측정합니다. (최대 메모리가 서로 섞이지 않도록)"""
+    results = []
+    for size in sizes:
+        child_dir = os.path.join(workdir, f"train_{size}")
+        result_file = os.path.join(workdir, f"train_{size}.json")
+        cmd = [sys.executable, os.path.abspath(__file__), '--train-child', str(size), '--images', str(images),
+               '--dataset', dataset_dir, '--workdir', child_dir, '--result', result_file]
+        if verbose:
+            cmd.append('--verbose')
+        proc = subprocess.run(cmd, cwd=config.BASE_DIR)
+        if proc.returncode != 0 or not os.path.exists(result_file):
+            results.append({"patients": size, "ok": False, "message": f"exit code {proc.returncode}"})
+            continue
+        with open(result_file, 'r', encoding='utf-8') as f:
+            results.append(json.load(f))
+        shutil.rmtree(child_dir, ignore_errors=True)
+        _log(f"   N={size}: {results[-1]['train_seconds']}초, 최대 {results[-1]['peak_rss_mb']}MB")
+    return results
+
+# ---------------- 비교 ----------------
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict):
+                tag = item.get('clients', item.get('patients'))
+                yield from _flatten(item, f"{prefix}{tag}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix.rstrip('.'), value
+
+_COMPARE_KEYS = ('p50', 'p95', 'p99', 'requests_per_sec', 'train_seconds', 'incremental_seconds', 'peak_rss_mb',
+                 'top1_accuracy', 'identified_rate', 'face_found_rate')
+
+def compare(old, new):
+    """두 결과의 주요 수치를 나란히 출력합니다."""
+    old_values = dict(_flatten(old))
+    print(f"{'항목':<55}{'이전':>12}{'현재':>12}{'변화':>9}")
+    for key, value in _flatten(new):
+        if key.rsplit('.', 1)[-1] not in _COMPARE_KEYS or key not in old_values:
+            continue
+        before = old_values[key]
+        change = f"{(value - before) / before * 100:+.1f}%" if before else "-"
+        print(f"{key:<55}{before:>12}{value:>12}{change:>9}")
+
+# ---------------- 실행 ----------------
+def _environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=config.BASE_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "opencv": cv2.__version__,
+            "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+            "train_workers": config.TRAIN_WORKERS, "started_at": datetime.datetime.now().isoformat(timespec='seconds')}
+
+def _int_list(text):
+    return [int(x) for x in text.split(',') if x.strip()]
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='healid_bench_')
+    dataset_dir = os.path.join(workdir, 'dataset')
+    result = {"environment": _environment_info(), "options": {
+        "patients": args.patients, "images": args.images, "probes": args.probes,
+        "train_sizes": args.train_sizes, "clients": args.clients, "requests": args.requests}}
+    try:
+        fhir_server, fhir_url = start_fhir_stub(args.patients)
+        db = prepare_environment(os.path.join(workdir, 'server'), fhir_url)
+
+        with quiet(not args.verbose):
+            import face_recognizer
+            from flask_app import app
+
+            _log(f"[BENCH] 합성 데이터 생성: 환자 {max(args.train_sizes + [args.patients])}명 x {args.images}장")
+            result["dataset"] = build_dataset(dataset_dir, max(args.train_sizes + [args.patients]), args.images)
+
+            _log(f"[BENCH] 식별 모델 준비: 환자 {args.patients}명")
+            load_patients(db, dataset_dir, args.patients, args.images)
+            face_recognizer.train_model_process(full_rebuild=True)
+            face_recognizer.reload_label_map()
+
+            probes = make_probes(args.patients, args.images, args.probes)
+            _log("[BENCH] 단계별 식별 시간 측정")
+            bench_stages(probes[:5])     # 예열 (memmap 페이지, 검출기 초기화)
+            result["identify"] = bench_stages(probes)
+
+            handler = WSGIRequestHandler if args.verbose else _QuietRequestHandler
+            server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=handler)
+            threading.Thread(target=server.serve_forever, name="bench-http", daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+            _log("[BENCH] HTTP 엔드포인트 측정")
+            result["endpoint"] = bench_endpoints(base_url, probes, args.patients)
+            _log("[BENCH] 동시 요청 처리량 측정")
+            result["concurrency"] = bench_concurrency(base_url, probes, args.clients, args.requests)
+            server.shutdown()
+            fhir_server.shutdown()
+
+        _log(f"[BENCH] 학습 규모별 측정: N = {args.train_sizes}")
+        result["training"] = bench_training(args.train_sizes, args.images, dataset_dir, workdir, args.verbose)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Heal ID 오프라인 벤치마크")
+    parser.add_argument('--patients', type=int, default=50, help="식별 측정에 쓸 환자 수")
+    parser.add_argument('--images', type=int, default=10, help="환자당 학습 이미지 수")
+    parser.add_argument('--probes', type=int, default=100, help="식별 측정 프레임 수")
+    parser.add_argument('--train-sizes', type=_int_list, default=[25, 50, 100], help="학습 측정 환자 수 (쉼표 구분)")
+    parser.add_argument('--clients', type=_int_list, default=[1, 4, 8], help="동시 클라이언트 수 (쉼표 구분)")
+    parser.add_argument('--requests', type=int, default=200, help="동시 측정 단계별 요청 수")
+    parser.add_argument('--output', help="결과 JSON 파일 (없으면 표준 출력)")
+    parser.add_argument('--compare', help="비교할 이전 결과 JSON 파일")
+    parser.add_argument('--workdir', help="작업 폴더 (지정하면 지우지 않음)")
+    parser.add_argument('--keep', action='store_true', help="임시 작업 폴더를 지우지 않음")
+    parser.add_argument('--verbose', action='store_true', help="서버 모듈 로그 출력")
+    # 학습 측정용 하위 프로세스 인자
+    parser.add_argument('--train-child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--dataset', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.train_child:
+        return train_child(args)
+
+    result = run(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        _log(f"[BENCH] 결과 저장: {args.output}")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), result)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
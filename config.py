@@ -7,9 +7,101 @@ DB_CONFIG = {
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FACES_DIR = os.path.join(BASE_DIR, 'Faces')
+# 환자별 얼굴 이미지 인덱스 (Faces 폴더 전체 스캔 방지)
+FACE_INDEX_FILE = os.path.join(FACES_DIR, '.index')
+# 얼굴 이미지 묶음 저장소 (face_pack.py): 세그먼트 파일 폴더, 세그먼트 1개의 최대 크기(바이트)
+FACE_PACK_DIR = os.path.join(BASE_DIR, 'face_pack')
+FACE_PACK_SEGMENT_BYTES = 64 * 1024 * 1024
+# /face_image 썸네일: 긴 변 크기(px), 메모리 캐시 항목 수, 브라우저 캐시 유효 시간(초)
+FACE_THUMB_SIZE = 160
+FACE_THUMB_CACHE_SIZE = 1000
+FACE_THUMB_MAX_AGE = 300
 MODEL_FILE = os.path.join(BASE_DIR, 'desa.yml')
+# 바이너리 모델 (memmap으로 바로 여는 LBPH 히스토그램 행렬, model_io.py)
+MODEL_BIN_FILE = os.path.join(BASE_DIR, 'desa.lbph')
+# 모델에 이미 반영된 이미지 목록 (증분 학습용, 모델 파일 옆에 저장)
+MODEL_STATE_FILE = os.path.join(BASE_DIR, 'desa_state.json')
+# 이미지별 LBPH 특징 캐시 (재학습 시 JPEG 재디코딩 방지)
+FEATURE_CACHE_DIR = os.path.join(BASE_DIR, 'feature_cache')
+# 학습 시 이미지 디코딩/특징 추출 병렬 작업자 수와 한 번에 처리할 이미지 수 (메모리 상한)
+TRAIN_WORKERS = os.cpu_count() or 4
+TRAIN_CHUNK_SIZE = 256
+# 식별 시 돌려줄 후보 환자 수 (의료진 확인용)
+RECOGNITION_TOP_K = 5
+# 다중 얼굴 식별(/identify_faces)에서 한 프레임당 처리할 최대 얼굴 수
+MULTI_FACE_MAX = 10
+# 다중 프레임 식별(/identify_batch): 요청당 최대 프레임 수, 확정에 필요한 득표 비율(얼굴이 보인 프레임 기준)
+BATCH_MAX_FRAMES = 10
+BATCH_MIN_AGREEMENT = 0.5
+
+# 식별 세션 (프레임 간 상태 유지): 미사용 세션 만료 시간(초), 보관할 최근 결과 수
+SESSION_TTL = 60
+SESSION_HISTORY = 10
+# 세션 프레임 중복 판정: 16x16 축소 영상의 평균 밝기 차이가 이보다 작으면 직전 결과 재사용,
+# 재사용 최대 시간(초), 확정된 환자를 같은 얼굴이 추적되는 동안 다시 식별하지 않고 유지하는 시간(초)
+FRAME_DEDUP_THRESHOLD = 4.0
+FRAME_DEDUP_MAX_AGE = 2.0
+IDENTITY_HOLD_SECONDS = 3.0
+# WebSocket 스트리밍 식별에서 받는 프레임 최대 크기 (바이트)
+STREAM_MAX_FRAME_BYTES = 2 * 1024 * 1024
+
+# 얼굴 검출 (face_detector.py): 전체 검출 시 영상 축소 배율(1.0이면 원본), 찾을 최소 얼굴 크기(원본 px)
+# (축소해도 최소 얼굴이 검출 창(24px) 이상으로 남는 배율까지만 줄임. 예: 최소 얼굴 60px이면 0.4까지)
+# 이전 프레임 얼굴 주변 탐색 여백(얼굴 크기 대비), 추적 시 찾을 얼굴 크기 범위(이전 크기 대비)
+DETECT_SCALE = 1.0
+DETECT_MIN_FACE = 30
+TRACK_PADDING = 0.5
+TRACK_SIZE_RANGE = (0.7, 1.4)
+
+# 영상 처리 작업 풀 (vision_pool.py): 작업자 스레드 수, 요청 작업 최대 대기 수(넘으면 503),
+# 요청 작업이 대기열에서 기다리는 최대 시간(초, 넘으면 실행하지 않고 503)
+VISION_WORKERS = os.cpu_count() or 4
+VISION_QUEUE_LIMIT = 16
+VISION_MAX_WAIT = 2.0
+
+# DB 커넥션 풀 크기(mysql.connector 최대 32)와 빈 연결을 기다리는 최대 시간(초)
+DB_POOL_SIZE = 10
+DB_POOL_TIMEOUT = 5
+
+# 환자 존재 여부 캐시 (db_manager.py): 최대 항목 수, 유효 시간(초), '없음' 결과 유효 시간(초)
+PATIENT_CACHE_SIZE = 10000
+PATIENT_CACHE_TTL = 300
+PATIENT_CACHE_NEGATIVE_TTL = 10
+
+# 처리 시간 지표 수집 (/metrics, metrics.py)
+METRICS_ENABLED = True
+
+# 관리용 API(/delete_patients) 접근 토큰: 서버 PC(127.0.0.1)가 아닌 곳에서는 X-Admin-Token 헤더로 이 값을 보내야 함
+# (비어 있으면 서버 PC에서만 호출 가능)
+ADMIN_TOKEN = os.environ.get('HEALID_ADMIN_TOKEN', '')
 
 FHIR_SERVER_URL = "http://cpslab.jejunu.ac.kr:10002/hapi-fhirstarters-simple-server"
+# FHIR 클라이언트 (fhir_client.py): keep-alive 커넥션 수, 동시 요청 상한, 연결/응답 타임아웃(초)
+FHIR_POOL_SIZE = 10
+FHIR_MAX_CONCURRENT = 8
+FHIR_CONNECT_TIMEOUT = 3
+FHIR_READ_TIMEOUT = 5
+# 조회 요청 재시도 횟수와 백오프 계수(초), 서킷 브레이커: 연속 실패 횟수 / 차단 시간(초)
+FHIR_RETRIES = 2
+FHIR_RETRY_BACKOFF = 0.3
+FHIR_BREAKER_THRESHOLD = 5
+FHIR_BREAKER_RESET = 30
+# FHIR 환자 생성 지연 전송 (fhir_outbox.py): 사용 여부, 대기열 저널, 한 번에 보낼 환자 수,
+# 전송 주기(초), 실패 시 최대 재시도 간격(초)
+FHIR_WRITE_BEHIND = True
+FHIR_OUTBOX_FILE = os.path.join(BASE_DIR, 'fhir_outbox.jsonl')
+FHIR_OUTBOX_BATCH_SIZE = 20
+FHIR_OUTBOX_FLUSH_INTERVAL = 2
+FHIR_OUTBOX_MAX_BACKOFF = 300
+# FHIR ID를 받기 전까지 쓰는 임시 로컬 환자 ID의 시작값과 식별자 system
+LOCAL_ID_BASE = 900000000
+LOCAL_ID_SYSTEM = "urn:heal-id:local-patient-id"
+# FHIR 대량 동기화 도구 (fhir_sync.py): 동시 요청 수, Bundle / DB 묶음 크기
+FHIR_SYNC_WORKERS = 8
+FHIR_SYNC_BATCH_SIZE = 200
+# FHIR Patient 리소스 캐시: 최대 환자 수, 재검증 없이 쓰는 시간(초)
+FHIR_PATIENT_CACHE_SIZE = 1000
+FHIR_PATIENT_CACHE_TTL = 60
 
 if not os.path.exists(FACES_DIR):
 
@@ -1,81 +1,76 @@
-import os
-import mysql.connector
 import sys
+import mysql.connector
+import db_manager
+from face_store import get_face_index
+import face_recognizer
 
 # ========================================================
 # 얼굴인식을 잘 못하는 경우 지워서 다시 학습시키기 위한 스크립트
 # ========================================================
 
-# DB 설정 (Manager.py와 동일)
-DB_CONFIG = {
-    
-}
-
-# 파일 경로 설정
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-FACES_DIR = os.path.join(BASE_DIR, 'Faces')
-MODEL_FILE = os.path.join(BASE_DIR, 'desa.yml')  # 삭제할 모델 파일 경로 추가
+# IN (...) 목록 하나에 넣는 최대 ID 수 (아주 많은 ID도 한 트랜잭션 안에서 나눠 실행)
+_IN_CHUNK = 1000
 
 # ========================================================
 # 데이터 삭제 로직
 # ========================================================
 
-def delete_patient_data(patient_id):
-    """데이터베이스, 파일 시스템, 그리고 학습 모델에서 관련 데이터를 삭제합니다."""
-    print(f"\n🗑️ --- ID [{patient_id}] 환자 데이터 완전 삭제를 시작합니다. ---")
-
-    # 1. 데이터베이스에서 환자 정보 삭제
-    conn = None
+def _delete_db_rows(patient_ids):
+    """[최적화] 커넥션 1개, 트랜잭션 1개로 DELETE ... WHERE id IN (...)을 실행합니다."""
+    conn, cursor = db_manager.get_db_connection()
+    if not conn:
+        print("❌ [DB 오류] 커넥션을 가져오지 못했습니다.")
+        return None
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id FROM patients WHERE id = %s", (patient_id,))
-        if not cursor.fetchone():
-            print(f"ℹ️ [DB] ID {patient_id} 환자는 데이터베이스에 없습니다.")
-        else:
-            cursor.execute("DELETE FROM patients WHERE id = %s", (patient_id,))
-            conn.commit()
-            if cursor.rowcount > 0:
-                print(f"✅ [DB] ID {patient_id} 환자 정보 삭제 완료.")
-
+        deleted = 0
+        for start in range(0, len(patient_ids), _IN_CHUNK):
+            chunk = patient_ids[start:start + _IN_CHUNK]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM patients WHERE id IN ({placeholders})", chunk)
+            deleted += cursor.rowcount
+        conn.commit()
+        return deleted
     except mysql.connector.Error as err:
-        print(f"❌ [DB 오류] 데이터 삭제 중 오류 발생: {err}")
+        conn.rollback()
+        print(f"❌ [DB 오류] 데이터 삭제 중 오류 발생 (전체 취소): {err}")
+        return None
     finally:
-        if conn and conn.is_connected():
-            conn.close()
+        cursor.close()
+        conn.close()
 
-    # 2. 파일 시스템에서 얼굴 이미지 삭제
-    if not os.path.exists(FACES_DIR):
-        print(f"ℹ️ [파일] '{FACES_DIR}' 폴더가 존재하지 않습니다.")
-    else:
-        deleted_count = 0
-        for filename in os.listdir(FACES_DIR):
-            if filename.startswith(f"{patient_id}_"):
-                try:
-                    os.remove(os.path.join(FACES_DIR, filename))
-                    deleted_count += 1
-                except OSError as e:
-                    print(f"❌ [파일 오류] '{filename}' 삭제 실패: {e}")
-        
-        if deleted_count > 0:
-            print(f"✅ [파일] 얼굴 이미지 {deleted_count}장 삭제 완료.")
-        else:
-            print(f"ℹ️ [파일] 삭제할 얼굴 이미지가 없습니다.")
+def delete_patients(patient_ids):
+    """여러 환자의 데이터를 데이터베이스, 파일 시스템, 그리고 학습 모델에서 한 번에 삭제합니다."""
+    patient_ids = list(dict.fromkeys(str(pid) for pid in patient_ids))
+    if not patient_ids:
+        return {"requested": 0, "db_deleted": 0, "images_deleted": 0, "samples_removed": 0}
+    print(f"\n🗑️ --- 환자 {len(patient_ids)}명 데이터 삭제를 시작합니다. ---")
 
-    # 3. 학습된 모델 파일(yml) 삭제 (추가된 부분)
-    # 특정 환자만 모델에서 빼는 것은 어렵기 때문에, 모델 파일을 통째로 지워 재학습을 유도합니다.
-    if os.path.exists(MODEL_FILE):
-        try:
-            os.remove(MODEL_FILE)
-            print(f"⚠️ [모델] 기존 학습 파일('desa.yml')을 삭제했습니다.")
-            print(f"   👉 중요: 'AI 모델 학습' 버튼을 다시 눌러주세요!")
-        except OSError as e:
-            print(f"❌ [모델 오류] 모델 파일 삭제 실패: {e}")
-    else:
-        print(f"ℹ️ [모델] 삭제할 모델 파일이 없습니다.")
+    # 1. 데이터베이스에서 환자 정보 삭제 (한 트랜잭션)
+    db_deleted = _delete_db_rows(patient_ids)
+    if db_deleted is None:
+        return {"requested": len(patient_ids), "error": "DB 삭제 실패"}
+    print(f"✅ [DB] 환자 정보 {db_deleted}건 삭제 완료. (없는 ID {len(patient_ids) - db_deleted}건)")
+
+    # 2. 얼굴 이미지 삭제
+    # 폴더 전체를 훑지 않고 인덱스에서 해당 환자들의 이미지만 찾아, 묶음 저장소에서는 0으로 덮어쓰고 개별 파일은 지웁니다.
+    images_deleted = get_face_index().purge_patients(patient_ids)
+    print(f"✅ [파일] 얼굴 이미지 {images_deleted}장 삭제 완료.")
+
+    # 3. 학습된 모델에서 해당 환자 샘플만 제거 (모델 파일을 지우지 않으므로 재학습 없이 식별 계속 가능)
+    samples_removed = face_recognizer.remove_patients_from_model(patient_ids)
+    if samples_removed == 0:
+        print("ℹ️ [모델] 모델에 해당 환자의 샘플이 없습니다.")
 
-    print(f"--- ID [{patient_id}] 삭제 작업 완료 ---\n")
+    # 캐시/라벨 매핑에서도 제거
+    db_manager.notify_patient_change("deleted", patient_ids)
+
+    print(f"--- 환자 {len(patient_ids)}명 삭제 작업 완료 ---\n")
+    return {"requested": len(patient_ids), "db_deleted": db_deleted,
+            "images_deleted": images_deleted, "samples_removed": samples_removed}
+
+def delete_patient_data(patient_id):
+    """데이터베이스, 파일 시스템, 그리고 학습 모델에서 관련 데이터를 삭제합니다."""
+    return delete_patients([patient_id])
 
 if __name__ == "__main__":
     # 사용법 1 (인자 전달): python delete_patient_data.py 6 7 8
@@ -102,8 +97,8 @@ if __name__ == "__main__":
                 sys.exit(1)
 
     if pids_to_delete:
-        for pid in pids_to_delete:
-            delete_patient_data(pid)
+        # 실행 중인 서버에는 POST /delete_patients 를 사용하면 서버 메모리의 모델에도 바로 반영됩니다.
+        delete_patients(pids_to_delete)
     else:
 
         print("ℹ️ 삭제할 ID가 입력되지 않았습니다. 프로그램을 종료합니다.")
@@ -1,73 +1,159 @@
 import mysql.connector
-from config import DB_CONFIG, FHIR_SERVER_URL
+from config import (DB_CONFIG, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+                    PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL, PATIENT_CACHE_NEGATIVE_TTL)
 import datetime
-import requests
+import threading
 import time
+import requests
+from fhir_client import get_fhir_client
+from ttl_cache import TTLCache
+import metrics
 
 # ==================================================================
 # [최적화] DB 커넥션 풀 사용 (매번 연결 생성/종료 비용 감소)
+# mysql.connector 풀은 연결이 모두 사용 중이면 바로 실패하므로,
+# 풀 크기만큼의 자리(semaphore)를 두고 빈 자리가 날 때까지 DB_POOL_TIMEOUT초 기다립니다.
 # ==================================================================
 _connection_pool = None
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+_pool_lock = threading.Lock()
+_pool_stats = {"acquired": 0, "waited": 0, "timeouts": 0, "in_use": 0, "max_in_use": 0,
+               "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
 
 def get_connection_pool():
     """커넥션 풀을 반환합니다 (싱글톤 패턴)"""
     global _connection_pool
-    if _connection_pool is None:
-        try:
-            _connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-                pool_name="heal_id_pool",
-                pool_size=5,
-                **DB_CONFIG
-            )
-            print("[INIT] DB 커넥션 풀 생성 완료")
-        except mysql.connector.Error as err:
-            print(f"❌ [DB 오류] 커넥션 풀 생성 실패: {err}")
+    with _pool_lock:
+        if _connection_pool is None:
+            try:
+                _connection_pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name="heal_id_pool",
+                    pool_size=DB_POOL_SIZE,
+                    **DB_CONFIG
+                )
+                print(f"[INIT] DB 커넥션 풀 생성 완료 (크기 {DB_POOL_SIZE})")
+            except mysql.connector.Error as err:
+                print(f"❌ [DB 오류] 커넥션 풀 생성 실패: {err}")
     return _connection_pool
 
+def _release_slot():
+    with _pool_lock:
+        _pool_stats["in_use"] -= 1
+    _pool_slots.release()
+
+class _PooledConnection:
+    """풀 연결을 감싸서 close() 할 때 대기 자리도 함께 반납합니다."""
+    def __init__(self, conn):
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        try:
+            self._conn.close()
+        finally:
+            _release_slot()
+
 def get_db_connection():
-    """커넥션 풀에서 연결을 가져옵니다."""
+    """커넥션 풀에서 연결을 가져옵니다. (모두 사용 중이면 DB_POOL_TIMEOUT초까지 대기)"""
+    started = time.perf_counter()
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        with _pool_lock:
+            _pool_stats["timeouts"] += 1
+        print(f"❌ [DB 오류] 커넥션 대기 시간 초과 ({DB_POOL_TIMEOUT}초, 풀 크기 {DB_POOL_SIZE})")
+        return None, None
+    waited = time.perf_counter() - started
+    metrics.db_pool_wait_seconds.observe(waited)
+    with _pool_lock:
+        _pool_stats["acquired"] += 1
+        _pool_stats["in_use"] += 1
+        _pool_stats["max_in_use"] = max(_pool_stats["max_in_use"], _pool_stats["in_use"])
+        _pool_stats["wait_seconds_total"] += waited
+        _pool_stats["wait_seconds_max"] = max(_pool_stats["wait_seconds_max"], waited)
+        if waited > 0.001:
+            _pool_stats["waited"] += 1
     try:
         pool = get_connection_pool()
         if pool:
-            conn = pool.get_connection()
+            conn = _PooledConnection(pool.get_connection())
             return conn, conn.cursor(dictionary=True)
     except mysql.connector.Error as err:
         print(f"❌ [DB 오류] 커넥션 가져오기 실패: {err}")
+    _release_slot()
     return None, None
 
+def get_pool_stats():
+    """커넥션 풀 크기, 사용 중인 연결 수, 대기/시간 초과 횟수, 대기 시간을 반환합니다."""
+    with _pool_lock:
+        stats = dict(_pool_stats, size=DB_POOL_SIZE)
+    stats["wait_seconds_total"] = round(stats["wait_seconds_total"], 4)
+    stats["wait_seconds_max"] = round(stats["wait_seconds_max"], 4)
+    return stats
+
+# ==================================================================
+# 환자 추가/삭제 알림 (얼굴 인식 모듈의 라벨 매핑 갱신용)
+# ==================================================================
+_patient_listeners = []
+
+def add_patient_listener(callback):
+    """환자가 추가/삭제될 때 callback(event, patient_ids)를 호출하도록 등록합니다."""
+    _patient_listeners.append(callback)
+
+def notify_patient_change(event, patient_ids):
+    """등록된 리스너에게 환자 변경('added' / 'deleted')을 알립니다."""
+    if event == "deleted":
+        invalidate_patients(patient_ids)
+    for callback in _patient_listeners:
+        try:
+            callback(event, list(patient_ids))
+        except Exception as e:
+            print(f"⚠️ 환자 변경 알림 처리 실패: {e}")
+
 # ==================================================================
 # [최적화] 캐시: 환자 존재 여부 (5초마다 같은 ID 조회 방지)
+# 여러 요청 스레드가 동시에 쓰므로 잠금이 있는 LRU + TTL 캐시를 사용합니다. (용량 고정)
+# '없음' 결과는 곧 등록될 수 있으므로 짧게 보관합니다.
 # ==================================================================
-_patient_cache = {}
-_cache_timestamp = {}
-CACHE_TTL = 300  # 5분 캐시
+_patient_cache = TTLCache(PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL)
+
+def _cache_key(patient_id):
+    return str(patient_id)
+
+def invalidate_patients(patient_ids):
+    """삭제된 환자를 존재 여부 캐시에서 제거합니다."""
+    _patient_cache.invalidate_many(_cache_key(pid) for pid in patient_ids)
+
+def get_patient_cache_stats():
+    return _patient_cache.get_stats()
 
 def check_patient_exists(patient_id):
     """환자 존재 여부를 캐시와 함께 확인합니다."""
-    current_time = time.time()
-    
     # 캐시에 있고 유효기간 내면 바로 반환
-    if patient_id in _patient_cache:
-        if current_time - _cache_timestamp.get(patient_id, 0) < CACHE_TTL:
-            return _patient_cache[patient_id]
+    cached = _patient_cache.get(_cache_key(patient_id))
+    if cached is not None:
+        return cached
     
     conn, cursor = get_db_connection()
     if not conn: 
         return False, "DB 연결 실패"
 
     try:
-        cursor.execute("SELECT id, last_updated FROM patients WHERE id = %s", (patient_id,))
-        result = cursor.fetchone()
+        with metrics.db_query_seconds.time("check_patient"):
+            cursor.execute("SELECT id, last_updated FROM patients WHERE id = %s", (patient_id,))
+            result = cursor.fetchone()
         
         if result:
             last_updated = result.get('last_updated')
             response = (True, str(last_updated) if last_updated else "기존 데이터 있음")
+            _patient_cache.set(_cache_key(patient_id), response)
         else:
             response = (False, "신규 등록")
-        
-        # 캐시 저장
-        _patient_cache[patient_id] = response
-        _cache_timestamp[patient_id] = current_time
+            _patient_cache.set(_cache_key(patient_id), response, ttl=PATIENT_CACHE_NEGATIVE_TTL)
         
         return response
     except Exception as e:
@@ -92,12 +178,17 @@ def register_or_update_patient(patient_id):
             ON DUPLICATE KEY UPDATE last_updated = %s
         """
         now = datetime.datetime.now()
-        cursor.execute(sql, (patient_id, now, now))
-        conn.commit()
+        with metrics.db_query_seconds.time("upsert_patient"):
+            cursor.execute(sql, (patient_id, now, now))
+            conn.commit()
+        # MySQL UPSERT: rowcount 1 = 새로 추가, 2 = 기존 행 갱신
+        inserted = cursor.rowcount == 1
         
         # 캐시 갱신
-        _patient_cache[patient_id] = (True, str(now))
-        _cache_timestamp[patient_id] = time.time()
+        _patient_cache.set(_cache_key(patient_id), (True, str(now)))
+
+        if inserted:
+            notify_patient_change("added", [patient_id])
         
         return True, f"환자 ID [{patient_id}] DB 처리 완료."
     except mysql.connector.Error as err:
@@ -108,19 +199,61 @@ def register_or_update_patient(patient_id):
             cursor.close()
             conn.close()
 
+def ensure_patient_registered(patient_id):
+    """[최적화] 캐시에 이미 등록된 환자로 있으면 DB 쓰기 없이 넘어갑니다.
+
+    얼굴 등록처럼 같은 환자로 짧은 시간에 요청이 몰릴 때 프레임마다 UPSERT + commit 하지 않도록 합니다.
+    """
+    cached = _patient_cache.get(_cache_key(patient_id))
+    if cached is not None and cached[0]:
+        return True, f"환자 ID [{patient_id}] 이미 등록됨."
+    return register_or_update_patient(patient_id)
+
+def rename_patient(old_id, new_id):
+    """환자 ID를 바꿉니다. (임시 로컬 ID -> FHIR 서버가 부여한 ID)
+
+    새 ID의 행이 이미 있으면(그 사이 새 ID로 등록된 경우) 임시 ID 행만 지웁니다.
+    """
+    conn, cursor = get_db_connection()
+    if not conn: 
+        return False, "DB 연결 실패"
+
+    try:
+        cursor.execute("SELECT id FROM patients WHERE id = %s", (new_id,))
+        if cursor.fetchone():
+            cursor.execute("DELETE FROM patients WHERE id = %s", (old_id,))
+        else:
+            cursor.execute("UPDATE patients SET id = %s WHERE id = %s", (new_id, old_id))
+        conn.commit()
+        invalidate_patients([old_id, new_id])
+        notify_patient_change("renamed", [old_id, new_id])
+        return True, f"환자 ID [{old_id}] -> [{new_id}] 변경 완료."
+    except mysql.connector.Error as err:
+        print(f"⚠️ DB 저장 에러: {err}")
+        return False, f"DB 오류: {err}"
+    finally:
+        if conn:
+            cursor.close()
+            conn.close()
+
 # ==================================================================
 # [최적화 제거] FHIR 서버 전송 함수 (5초마다 호출 시 불필요)
 # 필요할 때만 명시적으로 호출하도록 변경
 # ==================================================================
-def send_to_fhir_server(fhir_data):
-    """FHIR 서버로 환자 데이터 전송 (필요시에만 호출)"""
+def send_to_fhir_server(fhir_data, if_none_exist=None):
+    """FHIR 서버로 환자 데이터 전송 (필요시에만 호출)
+
+    if_none_exist(검색 조건)가 주어지면 조건부 생성으로 같은 환자를 두 번 만들지 않습니다.
+    """
     headers = {'Content-Type': 'application/json'}
+    if if_none_exist:
+        headers['If-None-Exist'] = if_none_exist
     try:
-        response = requests.post(
-            f"{FHIR_SERVER_URL}/Patient", 
+        # [최적화] 공용 클라이언트 (keep-alive 커넥션 풀, 서킷 브레이커)
+        response = get_fhir_client().post(
+            "/Patient", 
             json=fhir_data, 
-            headers=headers,
-            timeout=5  # 타임아웃 추가
+            headers=headers
         )
         
         if response.status_code in [200, 201]:
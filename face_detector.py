@@ -0,0 +1,102 @@
+import threading
+import time
+import cv2
+from config import DETECT_SCALE, DETECT_MIN_FACE, TRACK_PADDING, TRACK_SIZE_RANGE
+
+# ==================================================================
+# [최적화] 얼굴 검출 (축소 검출 + 세션별 얼굴 위치 추적)
+# 원본 해상도 전체에 detectMultiScale을 돌리는 것이 식별 요청에서 가장 비싼 단계입니다.
+#   1) 전체 검출: 프레임을 DETECT_SCALE 배로 줄인 영상에서 찾고 좌표를 원본 해상도로 되돌립니다.
+#      (최소 얼굴 크기가 줄인 영상에서 검출 창보다 작아지지 않도록 배율을 제한)
+#   2) 추적 검출: 직전 프레임의 얼굴 주변(여백 TRACK_PADDING)만, 직전 크기 근처의 얼굴만 찾습니다.
+#      찾지 못하면 1)의 전체 검출로 다시 찾습니다.
+# 잘라내는 얼굴 영역은 항상 원본 해상도 이미지에서 가져오므로 식별 정확도에는 영향이 없습니다.
+# ==================================================================
+_SCALE_FACTOR = 1.1
+_MIN_NEIGHBORS = 5
+
+class FaceDetector:
+    def __init__(self, cascade_path, scale=DETECT_SCALE, min_face=DETECT_MIN_FACE,
+                 track_padding=TRACK_PADDING, track_size_range=TRACK_SIZE_RANGE):
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        self.min_face = min_face
+        # 캐스케이드는 검출 창(기본 24x24)보다 작은 얼굴을 찾지 못하므로,
+        # 축소 후에도 min_face가 검출 창 크기 이상이 되는 배율까지만 줄임
+        window = max(self.cascade.getOriginalWindowSize()) if not self.cascade.empty() else 0
+        self.scale = min(1.0, max(0.1, scale, window / min_face if min_face else 0))
+        self.track_padding = track_padding
+        self.track_size_range = track_size_range
+        self._stats_lock = threading.Lock()
+        # 검출 방식별 (호출 수, 얼굴을 찾은 수, 누적 시간)
+        self._stats = {"full": [0, 0, 0.0], "tracked": [0, 0, 0.0]}
+
+    def _record(self, kind, found, started):
+        with self._stats_lock:
+            s = self._stats[kind]
+            s[0] += 1
+            s[1] += 1 if found else 0
+            s[2] += time.perf_counter() - started
+
+    def _scan_full(self, img):
+        """축소 영상에서 모든 얼굴을 찾아 원본 좌표 (x, y, w, h) 목록으로 반환합니다."""
+        started = time.perf_counter()
+        h, w = img.shape[:2]
+        small = img
+        if self.scale < 1.0:
+            small = cv2.resize(img, (max(1, round(w * self.scale)), max(1, round(h * self.scale))),
+                               interpolation=cv2.INTER_AREA)
+        fx, fy = w / small.shape[1], h / small.shape[0]
+        min_size = max(1, round(self.min_face / fx))
+        faces = self.cascade.detectMultiScale(small, _SCALE_FACTOR, _MIN_NEIGHBORS, minSize=(min_size, min_size))
+        boxes = [(int(round(x * fx)), int(round(y * fy)), int(round(bw * fx)), int(round(bh * fy)))
+                 for x, y, bw, bh in faces]
+        self._record("full", bool(boxes), started)
+        return boxes
+
+    def _scan_tracked(self, img, prev_box):
+        """직전 얼굴 주변 영역에서 비슷한 크기의 얼굴만 찾습니다. 없으면 None."""
+        started = time.perf_counter()
+        h, w = img.shape[:2]
+        px, py, pw, ph = prev_box
+        pad = int(max(pw, ph) * self.track_padding)
+        x0, y0 = max(0, px - pad), max(0, py - pad)
+        x1, y1 = min(w, px + pw + pad), min(h, py + ph + pad)
+        box = None
+        if x1 - x0 >= self.min_face and y1 - y0 >= self.min_face:
+            lo, hi = self.track_size_range
+            side = max(pw, ph)
+            min_size = max(self.min_face, int(side * lo))
+            max_size = max(min_size + 1, int(side * hi))
+            faces = self.cascade.detectMultiScale(img[y0:y1, x0:x1], _SCALE_FACTOR, _MIN_NEIGHBORS,
+                                                  minSize=(min_size, min_size), maxSize=(max_size, max_size))
+            if len(faces) > 0:
+                x, y, bw, bh = max(faces, key=lambda rect: rect[2] * rect[3])
+                box = (int(x) + x0, int(y) + y0, int(bw), int(bh))
+        self._record("tracked", box is not None, started)
+        return box
+
+    def detect_all(self, img):
+        """프레임의 모든 얼굴 영역을 큰 순서대로 반환합니다."""
+        return sorted(self._scan_full(img), key=lambda b: b[2] * b[3], reverse=True)
+
+    def detect(self, img, prev_box=None):
+        """가장 큰 얼굴 영역 (x, y, w, h)를 반환합니다. 없으면 None.
+
+        prev_box(직전 프레임의 얼굴 위치)가 주어지면 그 주변부터 찾습니다.
+        """
+        if prev_box is not None:
+            box = self._scan_tracked(img, prev_box)
+            if box is not None:
+                return box
+        boxes = self.detect_all(img)
+        return boxes[0] if boxes else None
+
+    def get_stats(self):
+        """검출 방식별(full / tracked) 호출 수, 얼굴을 찾은 수, 평균 소요시간(ms)을 반환합니다."""
+        with self._stats_lock:
+            stats = {"scale": self.scale}
+            for kind, (calls, found, total) in self._stats.items():
+                stats[f"{kind}_calls"] = calls
+                stats[f"{kind}_found"] = found
+                stats[f"{kind}_avg_ms"] = round(total * 1000 / calls, 2) if calls else None
+            return stats
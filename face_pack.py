@@ -0,0 +1,133 @@
+import os
+import mmap
+import struct
+import threading
+from config import FACE_PACK_DIR, FACE_PACK_SEGMENT_BYTES
+
+# ==================================================================
+# [최적화] 얼굴 이미지 묶음 저장소 (append-only 세그먼트 파일)
+# 작은 JPEG를 이미지마다 파일 하나로 만들지 않고, 세그먼트 파일(seg-000001.pack ...)에 이어 붙입니다.
+# 이미지 위치(세그먼트 번호, 오프셋, 길이)는 face_store의 인덱스 저널에 기록되며 읽기는 mmap으로 합니다.
+#   레코드 = 'HFP1' + 길이(uint32) + 이름 길이(uint16) + 이름(UTF-8) + JPEG 바이트
+# (레코드 머리는 사람이 세그먼트를 살펴볼 때와 검증용이며, 위치는 인덱스로만 찾습니다)
+# 삭제된 이미지는 즉시 0으로 덮어쓰고, 공간은 compact(face_store.py --compact)할 때 회수합니다.
+# ==================================================================
+_MAGIC = b'HFP1'
+_HEADER = struct.Struct('<4sIH')
+
+def _segment_id(name):
+    """'seg-000001.pack' 에서 번호를 꺼냅니다. (형식이 다르면 None)"""
+    if name.startswith('seg-') and name.endswith('.pack'):
+        try:
+            return int(name[4:-5])
+        except ValueError:
+            return None
+    return None
+
+class FacePack:
+    def __init__(self, pack_dir=FACE_PACK_DIR, segment_bytes=FACE_PACK_SEGMENT_BYTES):
+        self.pack_dir = pack_dir
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._maps = {}         # 세그먼트 번호 -> mmap (읽기 전용)
+        self._writer = None     # (세그먼트 번호, 파일 객체)
+
+    def _path(self, segment):
+        return os.path.join(self.pack_dir, f'seg-{segment:06d}.pack')
+
+    def segment_ids(self):
+        if not os.path.exists(self.pack_dir):
+            return []
+        return sorted(s for s in (_segment_id(name) for name in os.listdir(self.pack_dir)) if s is not None)
+
+    # ---------------- 쓰기 ----------------
+    def _open_writer(self, min_segment=0):
+        ids = self.segment_ids()
+        segment = max(ids[-1] if ids else 0, min_segment)
+        path = self._path(segment)
+        if segment == 0 or (os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes):
+            segment += 1
+        os.makedirs(self.pack_dir, exist_ok=True)
+        # 버퍼 없이 열어 레코드 1개를 write 1번으로 씀 (다른 프로세스와 레코드가 섞이지 않음)
+        self._writer = (segment, open(self._path(segment), 'ab', buffering=0))
+
+    def append(self, name, data):
+        """이미지 바이트를 현재 세그먼트 끝에 붙이고 (세그먼트 번호, 오프셋, 길이)를 반환합니다."""
+        encoded = name.encode('utf-8')
+        with self._lock:
+            if self._writer is None:
+                self._open_writer()
+            segment, f = self._writer
+            if f.tell() >= self.segment_bytes or not os.path.exists(self._path(segment)):
+                # 세그먼트가 가득 찼거나, compact로 지워졌으면 새 세그먼트로
+                f.close()
+                self._open_writer(segment + 1)
+                segment, f = self._writer
+            f.write(_HEADER.pack(_MAGIC, len(data), len(encoded)) + encoded + bytes(data))
+            return segment, f.tell() - len(data), len(data)
+
+    def scrub(self, locations):
+        """삭제된 이미지의 바이트를 0으로 덮어씁니다. (얼굴 데이터를 바로 지우기 위함)"""
+        by_segment = {}
+        for segment, offset, length in locations:
+            by_segment.setdefault(segment, []).append((offset, length))
+        for segment, ranges in by_segment.items():
+            try:
+                with open(self._path(segment), 'r+b') as f:
+                    for offset, length in ranges:
+                        f.seek(offset)
+                        f.write(b'\0' * length)
+            except FileNotFoundError:
+                continue
+
+    # ---------------- 읽기 ----------------
+    def read(self, segment, offset, length):
+        """이미지 바이트를 복사 없이 memoryview로 반환합니다. 없으면 None."""
+        with self._lock:
+            mm = self._maps.get(segment)
+            if mm is None or offset + length > len(mm):
+                # 처음 읽거나, 매핑한 뒤 세그먼트에 이미지가 더 붙었으면 다시 매핑
+                try:
+                    with open(self._path(segment), 'rb') as f:
+                        new_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    return None
+                # 이전 매핑은 닫지 않음 (다른 요청이 아직 읽는 중일 수 있으며, 참조가 사라지면 해제됨)
+                mm = self._maps[segment] = new_map
+            if offset + length > len(mm):
+                return None
+            return memoryview(mm)[offset:offset + length]
+
+    # ---------------- 정리 ----------------
+    def rewrite(self, records):
+        """(이름, 바이트) 목록만 새 세그먼트들에 순서대로 다시 쓰고 (첫 새 세그먼트 번호, {이름: 새 위치})를 반환합니다.
+
+        기존 세그먼트는 그대로 두므로, 새 인덱스를 저장한 뒤 remove_segments()로 지웁니다.
+        """
+        with self._lock:
+            if self._writer is not None:
+                self._writer[1].close()
+            ids = self.segment_ids()
+            self._open_writer((ids[-1] if ids else 0) + 1)
+            first_segment = self._writer[0]
+        locations = {name: self.append(name, data) for name, data in records}
+        with self._lock:
+            self._writer[1].close()
+            self._writer = None
+        return first_segment, locations
+
+    def remove_segments(self, before):
+        """번호가 before보다 작은 세그먼트 파일을 지웁니다. (지울 수 없는 파일은 다음에 정리)"""
+        with self._lock:
+            for segment in self.segment_ids():
+                if segment >= before:
+                    continue
+                self._maps.pop(segment, None)
+                try:
+                    os.remove(self._path(segment))
+                except OSError:
+                    pass
+
+    def size(self):
+        """세그먼트 파일 전체 크기(바이트)"""
+        return sum(os.path.getsize(self._path(s)) for s in self.segment_ids())
@@ -1,159 +1,515 @@
 import cv2
 import os
+import json
+import threading
 import numpy as np
-from config import FACES_DIR, MODEL_FILE
+from config import FACES_DIR, MODEL_FILE, MODEL_BIN_FILE, MODEL_STATE_FILE, RECOGNITION_TOP_K, MULTI_FACE_MAX, BATCH_MIN_AGREEMENT
 import db_manager 
+import metrics
+from face_store import get_face_index
+from face_detector import FaceDetector
+from sessions import identify_sessions, frame_signature
+from lbph_index import LBPHIndex
+from feature_cache import get_feature_cache, is_contiguous
+from model_io import save_model, load_model_file, convert_yaml
 
 # ========================================================
 # [최적화] 전역 변수 초기화 (서버 시작 시 1회만 로드하여 속도 향상)
 # ========================================================
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-recognizer = cv2.face.LBPHFaceRecognizer_create()
+# [최적화] 축소 검출 + 이전 얼굴 위치 추적 (face_detector.py)
+face_detector = FaceDetector(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# [최적화] 식별은 LBPH 히스토그램 인덱스(lbph_index.py)로 수행합니다.
+# 학습 결과는 바이너리 모델(desa.lbph, model_io.py)로 저장되며, 예전 desa.yml은 변환용으로만 읽습니다.
+hist_index = LBPHIndex()
+# 학습 스레드가 새 모델로 교체할 때 사용하는 잠금 (식별 요청은 잠금 없이 참조만 읽음)
+_swap_lock = threading.Lock()
+# 모델 파일/학습 상태를 바꾸는 작업(학습 저장~교체, 환자 샘플 제거)끼리 겹치지 않게 하는 잠금
+_model_lock = threading.Lock()
+# 학습이 진행되는 동안 삭제된 환자 ID (학습 결과를 교체하기 전에 빼냄, 학습 중이 아니면 None)
+_deleted_during_training = None
 
-# 서버 시작 시, 기존에 학습된 모델 파일이 있다면 미리 메모리에 올립니다.
-if os.path.exists(MODEL_FILE):
-    try:
-        recognizer.read(MODEL_FILE)
-        print(f"[INIT] 기존 모델 로드 완료: {MODEL_FILE}")
-    except Exception as e:
-        print(f"[INIT] 모델 로드 실패 (재학습 필요): {e}")
+# [최적화] 라벨 -> 환자 ID 매핑을 메모리에 상주시켜 식별 시 DB 조회를 없앱니다.
+# 모델 로드/학습 시 새로 만들고, 환자 추가/삭제 시 갱신합니다.
+_label_map = {}
 
 
 def get_label_id_map():
     """DB에서 '모델 라벨(숫자)'과 '환자 ID' 매핑 정보를 가져옵니다."""
     conn, cursor = db_manager.get_db_connection()
-    if not conn: return {}
+    if not conn: return None
     try:
-        cursor.execute("SELECT id, model_label FROM patients WHERE model_label IS NOT NULL")
-        mapping = {row['model_label']: row['id'] for row in cursor.fetchall()}
+        with metrics.db_query_seconds.time("label_map"):
+            cursor.execute("SELECT id, model_label FROM patients WHERE model_label IS NOT NULL")
+            mapping = {row['model_label']: row['id'] for row in cursor.fetchall()}
         return mapping
-    except: return {}
+    except Exception as e:
+        print(f"⚠️ 라벨 매핑 조회 실패: {e}")
+        return None
     finally:
         if conn: conn.close()
 
+def reload_label_map():
+    """DB에서 매핑을 다시 읽어 메모리의 매핑을 통째로 교체합니다."""
+    global _label_map
+    mapping = get_label_id_map()
+    if mapping is None:
+        return False
+    _label_map = mapping
+    return True
+
+def invalidate_label_map():
+    """매핑 갱신을 백그라운드 스레드로 예약합니다. (식별 요청은 기존 매핑을 계속 사용)"""
+    threading.Thread(target=reload_label_map, name="reload-label-map", daemon=True).start()
+
+def forget_patients(patient_ids):
+    """삭제된 환자의 라벨을 매핑에서 즉시 제거합니다."""
+    global _label_map
+    removed = {str(pid) for pid in patient_ids}
+    _label_map = {label: pid for label, pid in _label_map.items() if str(pid) not in removed}
+
+def _on_patient_change(event, patient_ids):
+    if event == "deleted":
+        forget_patients(patient_ids)
+    else:
+        invalidate_label_map()
+
+db_manager.add_patient_listener(_on_patient_change)
+
 def imread_safe(path):
     """한글 경로 등에서 이미지를 안전하게 읽어오는 함수"""
     try:
-        stream = open(path, "rb")
-        bytes = bytearray(stream.read())
-        numpyarray = np.asarray(bytes, dtype=np.uint8)
+        # [최적화] bytearray -> numpy 변환 복사 없이 파일을 바로 uint8 배열로 읽음
+        numpyarray = np.fromfile(path, dtype=np.uint8)
         return cv2.imdecode(numpyarray, cv2.IMREAD_GRAYSCALE)
     except Exception as e:
         print(f"❌ 이미지 읽기 실패 ({path}): {e}")
         return None
 
-def train_model_process():
-    """DB에 등록된 환자들의 얼굴 이미지를 읽어 모델을 학습시킵니다."""
-    faces = []
-    labels = []
-    
-    # [수정 완료] count 변수 초기화 (중요)
-    count = 0 
+def load_train_state():
+    """모델에 이미 반영된 이미지 목록({파일명: 라벨})을 읽어옵니다."""
+    if not os.path.exists(MODEL_STATE_FILE):
+        return None
+    try:
+        with open(MODEL_STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return {name: int(label) for name, label in state.get('files', {}).items()}
+    except Exception as e:
+        print(f"⚠️ 학습 상태 파일 읽기 실패 (전체 재학습 필요): {e}")
+        return None
+
+def save_train_state(trained_files):
+    """학습에 사용된 이미지 목록을 모델 파일 옆에 저장합니다. (임시 파일 후 교체)"""
+    tmp_path = MODEL_STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": 1, "files": trained_files}, f, ensure_ascii=False)
+    os.replace(tmp_path, MODEL_STATE_FILE)
+
+def collect_training_files(cursor):
+    """DB의 환자 목록과 Faces 폴더를 대조해 (환자ID, 라벨, 파일명) 목록을 만듭니다."""
+    cursor.execute("SELECT id FROM patients ORDER BY id ASC")
+    patients = cursor.fetchall()
+    face_index = get_face_index()
+
+    entries = []
+    for patient in patients:
+        pid = patient['id']
+
+        # 환자 ID를 그대로 라벨로 사용 (숫자만 가능)
+        model_label = int(pid)
+
+        # 해당 환자의 이미지 목록 (인덱스 조회, 폴더 스캔 없음)
+        for file_name in face_index.list_images(pid):
+            entries.append((pid, model_label, file_name))
+    return entries
+
+def swap_model(new_index, label_map):
+    """학습이 끝난 새 인덱스와 라벨 매핑으로 서비스 중인 상태를 한 번에 교체합니다."""
+    global hist_index, _label_map
+    with _swap_lock:
+        hist_index = new_index
+        _label_map = label_map
 
+def load_model():
+    """서버 시작 시 바이너리 모델(desa.lbph)을 memmap으로 열어 식별용 인덱스를 만듭니다.
+
+    바이너리 모델이 없고 예전 방식으로 학습된 desa.yml만 있으면 한 번 변환해 둡니다.
+    라벨 매핑은 백그라운드에서 읽으므로 서버 시작을 막지 않습니다.
+    """
+    try:
+        if not os.path.exists(MODEL_BIN_FILE) and os.path.exists(MODEL_FILE):
+            print(f"[INIT] {MODEL_FILE} -> {MODEL_BIN_FILE} 변환 중 (최초 1회)")
+            convert_yaml(MODEL_FILE, MODEL_BIN_FILE)
+        if not os.path.exists(MODEL_BIN_FILE) and not os.path.exists(MODEL_BIN_FILE + '.new'):
+            return False
+        swap_model(load_model_file(MODEL_BIN_FILE), _label_map)
+        invalidate_label_map()
+        print(f"[INIT] 기존 모델 로드 완료: {MODEL_BIN_FILE} ({len(hist_index)}개 샘플)")
+        return True
+    except Exception as e:
+        print(f"[INIT] 모델 로드 실패 (재학습 필요): {e}")
+        return False
+
+def remove_patients_from_model(patient_ids):
+    """[최적화] 삭제된 환자의 샘플만 식별 인덱스와 모델 파일에서 빼냅니다. (전체 재학습 없음)
+
+    남은 샘플을 새 모델 파일로 옮겨 쓴 뒤 서비스 중인 인덱스를 교체하므로
+    삭제 직후에도 다른 환자 식별은 그대로 동작합니다. 제거한 샘플 수를 반환합니다.
+    """
+    removed = {str(pid) for pid in patient_ids}
+    with _model_lock:
+        if _deleted_during_training is not None:
+            _deleted_during_training.update(removed)
+        return _remove_labels_from_model(removed)
+
+def _remove_labels_from_model(removed):
+    labels = {label for label, pid in _label_map.items() if str(pid) in removed}
+    labels |= {int(pid) for pid in removed if pid.isdigit()}
+
+    with _swap_lock:
+        index = hist_index
+    keep = ~np.isin(index.labels, np.fromiter(labels, dtype=np.int64, count=len(labels)))
+    dropped = int(len(index) - keep.sum())
+
+    # 학습 상태에서도 빼두어야 다음 증분 학습이 '사라진 이미지'로 보고 전체 라벨을 다시 쓰지 않음
+    trained = load_train_state()
+    if trained is not None:
+        save_train_state({name: label for name, label in trained.items() if label not in labels})
+    if dropped == 0:
+        return 0
+
+    save_model(MODEL_BIN_FILE, index, keep)
+    try:
+        new_index = load_model_file(MODEL_BIN_FILE, index.metric)
+    except OSError:
+        # Windows에서 파일 교체가 다음 시작으로 미뤄진 경우: 남은 샘플만 메모리로 복사해 사용
+        new_index = LBPHIndex(index.histograms[keep], index.labels[keep], index.metric, row_sums=index.row_sums[keep])
+    swap_model(new_index, {label: pid for label, pid in _label_map.items() if str(pid) not in removed})
+    print(f"✅ [모델] 환자 {len(removed)}명의 샘플 {dropped}개 제거 (남은 샘플 {len(new_index)}개)")
+    return dropped
+
+def train_model_process(full_rebuild=False, progress=None):
+    """DB에 등록된 환자들의 얼굴 이미지를 읽어 모델을 학습시킵니다.
+
+    이미지별 LBPH 특징은 feature_cache에 저장해 두고, 새로 생기거나 바뀐 이미지만
+    디코딩합니다. 식별용 인덱스는 캐시된 특징 행렬(memmap)을 그대로 사용하며,
+    서비스 중인 인덱스는 건드리지 않다가 모든 작업이 끝나면 swap_model()로 교체합니다.
+    full_rebuild=True 이면 캐시를 비우고 모든 이미지를 다시 읽습니다.
+    progress(stage, done, total)가 주어지면 진행 상황을 알려줍니다.
+    """
+    global _deleted_during_training
     if not os.path.exists(FACES_DIR):
         return False, "Faces 폴더가 없습니다."
 
     conn, cursor = db_manager.get_db_connection()
     if not conn: return False, "DB 연결 실패"
 
+    with _model_lock:
+        _deleted_during_training = set()
     try:
-        # 1. 기존 라벨 초기화 (충돌 방지용)
-        cursor.execute("UPDATE patients SET model_label = NULL")
-        conn.commit()
-
-        # 2. 환자 목록 가져오기
-        cursor.execute("SELECT id FROM patients ORDER BY id ASC")
-        patients = cursor.fetchall()
-        
         print("[INFO] 학습 데이터 스캔 중... (라벨 = 환자ID)")
-        
-        for patient in patients:
-            pid = patient['id']
-            
-            # 환자 ID를 그대로 라벨로 사용 (숫자만 가능)
-            model_label = int(pid) 
-            
-            # 해당 ID로 시작하는 파일 찾기
-            patient_imgs = [f for f in os.listdir(FACES_DIR) if f.startswith(f"{pid}_")]
-            
-            has_images = False
-            for file_name in patient_imgs:
-                path = os.path.join(FACES_DIR, file_name)
-                img_numpy = imread_safe(path)
-                
-                if img_numpy is not None:
-                    faces.append(img_numpy)
-                    labels.append(model_label)
-                    count += 1
-                    has_images = True
-            
-            # 이미지가 있는 경우에만 DB에 라벨(ID와 동일) 저장
-            if has_images:
-                cursor.execute("UPDATE patients SET model_label = %s WHERE id = %s", (model_label, pid))
-        
-        conn.commit()
-        
-        if count == 0:
-            return False, "학습할 유효한 이미지가 없습니다."
-
-        # 3. 모델 학습
-        recognizer.train(faces, np.array(labels))
-        
-        # 파일로 저장
-        recognizer.write(MODEL_FILE)
-        
-        print(f"✅ 모델 학습 완료: 총 {count}장 (라벨=ID 동기화됨)")
-        return True, f"총 {count}장 학습 완료"
+        if progress: progress("scanning", 0, 0)
+        entries = collect_training_files(cursor)
+
+        # 1. 새로 생기거나 바뀐 이미지만 디코딩하여 특징 캐시에 추가
+        cache = get_feature_cache()
+        trained = None if full_rebuild else load_train_state()
+        if full_rebuild:
+            cache.clear()
+        face_index = get_face_index()
+        rows = cache.update([file_name for _, _, file_name in entries], face_index.read_image, progress,
+                            fingerprint=face_index.fingerprint)
 
+        # 2~3. 모델 저장부터 교체까지는 환자 샘플 제거(/delete_patients)와 겹치지 않게 실행
+        with _model_lock:
+            return _finish_training(cursor, conn, cache, rows, entries, trained, progress)
     except Exception as e:
         print(f"❌ 학습 중 에러: {e}")
         return False, str(e)
     finally:
+        with _model_lock:
+            _deleted_during_training = None
         if conn: conn.close()
 
-def recognize_face(face_img):
-    """입력된 얼굴 이미지로 환자를 식별합니다."""
+def _finish_training(cursor, conn, cache, rows, entries, trained, progress):
+    """특징 추출이 끝난 학습 결과로 인덱스를 만들고 저장/라벨 기록/교체를 합니다. (_model_lock 안에서 호출)"""
+    # 학습 중에 삭제된 환자의 이미지는 제외 (삭제한 환자가 다시 식별되지 않도록)
+    deleted = _deleted_during_training or set()
+    loaded = sorted(((row, entry) for row, entry in zip(rows, entries)
+                     if row is not None and str(entry[0]) not in deleted), key=lambda x: x[0])
+    if not loaded:
+        return False, "학습할 유효한 이미지가 없습니다."
+
+    # 2. 인덱스 구성 (캐시 행이 연속이면 복사 없이 memmap 조각 사용, 아니면 캐시 정리 후 사용)
+    if progress: progress("training", 0, len(loaded))
+    row_list = [row for row, _ in loaded]
+    if not is_contiguous(row_list):
+        row_list = cache.compact(row_list)
+    labels = [label for _, (_, label, _) in loaded]
+    new_index = LBPHIndex(cache.features(row_list), labels)
+
+    if progress: progress("saving", len(loaded), len(loaded))
+    save_model(MODEL_BIN_FILE, new_index)
+    save_train_state({file_name: label for _, (_, label, file_name) in loaded})
+
+    # 3. DB 라벨(ID와 동일) 저장
+    current = {file_name for _, (_, _, file_name) in loaded}
+    new_entries = [entry for _, entry in loaded if trained is None or entry[2] not in trained]
+    if trained is None or any(name not in current for name in trained):
+        # 전체 학습이거나 학습된 이미지가 사라진 경우: 라벨 초기화 후 이미지가 있는 환자만 저장
+        cursor.execute("UPDATE patients SET model_label = NULL WHERE model_label IS NOT NULL")
+        labeled = {(pid, label) for _, (pid, label, _) in loaded}
+    else:
+        # 새 이미지가 생긴 환자만 라벨 저장
+        labeled = {(pid, label) for pid, label, _ in new_entries}
+    # [최적화] 환자별 UPDATE를 executemany 한 번으로 묶어 전송, 커밋은 학습 1회당 1번
+    if labeled:
+        cursor.executemany("UPDATE patients SET model_label = %s WHERE id = %s",
+                           [(model_label, pid) for pid, model_label in labeled])
+    conn.commit()
+
+    swap_model(new_index, {label: pid for _, (pid, label, _) in loaded})
+
+    if trained is None:
+        print(f"✅ 모델 학습 완료: 총 {len(loaded)}장 (라벨=ID 동기화됨)")
+        return True, f"총 {len(loaded)}장 학습 완료"
+    if not new_entries:
+        print("[INFO] 새로 추가된 이미지가 없습니다.")
+        return True, f"새 이미지 없음 (기존 {len(loaded)}장 유지)"
+    print(f"✅ 증분 학습 완료: 신규 {len(new_entries)}장 추가 (누적 {len(loaded)}장)")
+    return True, f"신규 {len(new_entries)}장 추가 학습 완료 (누적 {len(loaded)}장)"
+
+def recognize_faces_candidates(face_imgs, k=RECOGNITION_TOP_K):
+    """[최적화] 얼굴 여러 장의 후보 목록을 인덱스 조회 한 번으로 구합니다.
+
+    얼굴마다 가까운 환자 후보를 거리 순으로 최대 k명 반환하며,
+    각 후보는 {"patient_id", "distance", "votes", "score"} 형태입니다.
+    모델이 아직 없으면 None을 반환합니다.
+    """
+    # 학습 중 교체되더라도 이번 요청은 읽어둔 인덱스 하나로 끝까지 처리합니다.
+    index, label_map = hist_index, _label_map
+    if len(index) == 0:
+        return None
+    with metrics.stage_seconds.time("predict"):
+        results = index.query_batch(face_imgs, k)
+    for candidates in results:
+        for c in candidates:
+            # 라벨 -> 환자 ID 매핑 확인 (메모리 상주 매핑, DB 조회 없음, 없으면 라벨 그대로)
+            c["patient_id"] = label_map.get(c["label"]) or str(c["label"])
+    return results
+
+def recognize_face_candidates(face_img, k=RECOGNITION_TOP_K):
+    """입력된 얼굴과 가까운 환자 후보를 거리 순으로 최대 k명 반환합니다. (모델이 없으면 None)"""
+    results = recognize_faces_candidates([face_img], k)
+    return None if results is None else results[0]
+
+def _decide(candidates):
+    """후보 목록에서 (환자ID 또는 None, 신뢰도 또는 사유)를 결정합니다."""
+    # 아직 모델이 학습되지 않았거나 로드되지 않은 경우 예외 처리
+    if candidates is None:
+        return None, "모델이 학습되지 않음"
+    if not candidates:
+        return None, "Low Confidence"
+
+    best = candidates[0]
+    conf = best["distance"]
+
+    # 신뢰도 체크 (낮을수록 정확, 보통 50~80 사이를 임계값으로 잡음)
+    if conf < 100:
+        return best["patient_id"], conf
+    else:
+        return None, "Low Confidence"
+
+def recognize_face_topk(face_img, k=RECOGNITION_TOP_K):
+    """환자를 식별하고 (환자ID 또는 None, 신뢰도 또는 사유, 후보 목록)을 반환합니다."""
     try:
-        # [최적화] 매번 파일을 읽지 않고, 전역 변수 recognizer를 사용합니다.
-        
-        # 아직 모델이 학습되지 않았거나 로드되지 않은 경우 예외 처리
-        try:
-            label, conf = recognizer.predict(face_img)
-        except cv2.error:
-            return None, "모델이 학습되지 않음"
-        
-        # 신뢰도 체크 (낮을수록 정확, 보통 50~80 사이를 임계값으로 잡음)
-        if conf < 100:
-            # 라벨 -> 환자 ID 매핑 확인
-            mapping = get_label_id_map()
-            patient_id = mapping.get(label)
-            
-            if patient_id:
-                return patient_id, conf
-            else:
-                # 매핑 정보가 없으면 라벨(ID) 그대로 리턴
-                return str(label), conf
-        else:
-            return None, "Low Confidence"
+        candidates = recognize_face_candidates(face_img, k)
+        identified_id, conf = _decide(candidates)
+        return identified_id, conf, candidates or []
     except Exception as e:
         print(f"Recognize Error: {e}")
-        return None, "Error"
+        return None, "Error", []
+
+def recognize_face(face_img):
+    """입력된 얼굴 이미지로 환자를 식별합니다."""
+    identified_id, conf, _ = recognize_face_topk(face_img)
+    return identified_id, conf
+
+def decode_image(image_data):
+    """이미지 바이너리(JPEG 등)를 그레이스케일 배열로 디코딩합니다. 실패하면 None."""
+    try:
+        with metrics.stage_seconds.time("decode"):
+            nparr = np.frombuffer(image_data, np.uint8)
+            return cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+    except Exception:
+        return None
+
+def detect_face_box(img, prev_box=None):
+    """그레이스케일 이미지에서 가장 큰 얼굴 영역 (x, y, w, h)를 찾습니다. 없으면 None.
+
+    prev_box가 주어지면 그 주변을 먼저 찾고, 없을 때만 프레임 전체를 검출합니다.
+    """
+    # [최적화] 전역 변수로 로드된 face_detector 사용
+    with metrics.stage_seconds.time("detect"):
+        return face_detector.detect(img, prev_box)
 
 def detect_and_crop_face(image_data):
     """이미지 바이너리 데이터에서 얼굴을 찾아 크롭하여 반환합니다."""
-    try:
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-    except:
+    img = decode_image(image_data)
+    if img is None:
         return None, None
 
-    # [최적화] 전역 변수로 로드된 face_cascade 사용
-    faces = face_cascade.detectMultiScale(img, 1.1, 5, minSize=(30, 30))
-
-    if len(faces) > 0:
-        # 가장 큰 얼굴 영역을 선택
-        x, y, w, h = max(faces, key=lambda rect: rect[2] * rect[3])
+    box = detect_face_box(img)
+    if box:
+        x, y, w, h = box
         face_roi = img[y:y+h, x:x+w]
         return face_roi, img
     
-    return None, img
\ No newline at end of file
+    return None, img
+
+def identify_image(image_data, session=None):
+    """프레임 1장에서 얼굴을 찾아 식별하고, /identify_face 응답 형태의 dict를 반환합니다.
+
+    session(IdentifySession)이 주어지면 얼굴 위치와 식별 결과를 세션에 기록하며,
+    [최적화] 직전 처리 프레임과 거의 같은 프레임은 검출/식별 없이 직전 응답("cached": true)을 돌려줍니다.
+    """
+    img = decode_image(image_data)
+    if session is None:
+        return _identify_frame(img)
+
+    identify_sessions.count("frames")
+    signature = frame_signature(img) if img is not None else None
+    if signature is not None:
+        cached = session.cached_result(signature)
+        if cached is not None:
+            identify_sessions.count("deduplicated")
+            session.record(cached.get("patient_id"), cached.get("confidence"))
+            return cached
+    result = _identify_frame(img, session)
+    if signature is not None:
+        session.remember(signature, result)
+    return result
+
+def _identify_frame(img, session=None):
+    """디코딩된 프레임에서 얼굴을 찾아 식별합니다. (확정 유지 중이면 식별 생략, "held": true)"""
+    prev_box = session.last_box if session is not None else None
+    box = detect_face_box(img, prev_box) if img is not None else None
+    if session is not None:
+        session.last_box = box
+
+    if box is None:
+        if session is not None:
+            session.record(None, None)
+        return {"status": "searching", "message": "얼굴 탐색 중..."}
+
+    held = session.held_result(box) if session is not None else None
+    if held is not None:
+        identify_sessions.count("held")
+        session.record(held["patient_id"], held["confidence"])
+        return held
+
+    x, y, w, h = box
+    identified_id, conf, candidates = recognize_face_topk(img[y:y+h, x:x+w])
+    if session is not None:
+        session.record(identified_id, conf if identified_id else None)
+
+    if identified_id:
+        return {
+            "status": "ok",
+            "action": "redirect",
+            "patient_id": identified_id,
+            "message": f"Found {identified_id}",
+            "confidence": conf,
+            "candidates": candidates,
+            "box": list(box)
+        }
+    return {"status": "searching", "message": "Unknown", "candidates": candidates, "box": list(box)}
+
+def identify_faces_image(image_data, max_faces=MULTI_FACE_MAX):
+    """[최적화] 프레임에 보이는 모든 얼굴을 한 번에 식별합니다. (다수 환자 동시 접수용)
+
+    디코딩/검출은 프레임당 1회, 식별은 모든 얼굴을 묶어 인덱스 조회 1회로 처리하며
+    얼굴(큰 순서)마다 {"box", "patient_id", "confidence", "candidates"}를 반환합니다.
+    """
+    img = decode_image(image_data)
+    if img is None:
+        return {"status": "error", "message": "이미지를 읽을 수 없습니다."}
+    with metrics.stage_seconds.time("detect"):
+        boxes = face_detector.detect_all(img)[:max_faces]
+    if not boxes:
+        return {"status": "searching", "message": "얼굴 탐색 중...", "faces": []}
+
+    rois = [img[y:y+h, x:x+w] for x, y, w, h in boxes]
+    try:
+        results = recognize_faces_candidates(rois)
+    except Exception as e:
+        print(f"Recognize Error: {e}")
+        return {"status": "error", "message": str(e)}
+    if results is None:
+        return {"status": "error", "message": "모델이 학습되지 않음"}
+
+    faces = []
+    for box, candidates in zip(boxes, results):
+        identified_id, conf = _decide(candidates)
+        faces.append({
+            "box": list(box),
+            "patient_id": identified_id,
+            "confidence": conf if identified_id else None,
+            "candidates": candidates,
+        })
+    identified = sum(1 for f in faces if f["patient_id"])
+    return {"status": "ok", "count": len(faces), "identified": identified, "faces": faces}
+
+def identify_frames(frames, min_agreement=BATCH_MIN_AGREEMENT):
+    """[최적화] 같은 카메라에서 연속으로 찍은 프레임 여러 장으로 한 번에 식별합니다.
+
+    프레임마다 얼굴을 찾고(직전 프레임 얼굴 주변부터 탐색) 모든 얼굴을 인덱스 조회 1회로 식별한 뒤,
+    임계값을 통과한 프레임들의 신뢰도 가중 투표로 환자 1명을 결정합니다.
+    (가중치 = 100 - 거리, 얼굴이 보인 프레임 중 min_agreement 비율 이상이 같은 환자여야 확정)
+    """
+    rois, prev_box = [], None
+    for image_data in frames:
+        img = decode_image(image_data)
+        if img is None:
+            continue
+        box = detect_face_box(img, prev_box)
+        if box is not None:
+            x, y, w, h = box
+            rois.append(img[y:y+h, x:x+w])
+            prev_box = box
+
+    summary = {"frames": len(frames), "faces": len(rois)}
+    if not rois:
+        return {"status": "searching", "message": "얼굴 탐색 중...", **summary}
+    try:
+        results = recognize_faces_candidates(rois)
+    except Exception as e:
+        print(f"Recognize Error: {e}")
+        return {"status": "error", "message": str(e), **summary}
+    if results is None:
+        return {"status": "error", "message": "모델이 학습되지 않음", **summary}
+
+    # 환자별 (득표 수, 가중치 합, 최소 거리)
+    tally = {}
+    for candidates in results:
+        identified_id, conf = _decide(candidates)
+        if identified_id:
+            votes, weight, best = tally.get(identified_id, (0, 0.0, conf))
+            tally[identified_id] = (votes + 1, weight + (100 - conf), min(best, conf))
+    summary["votes"] = {str(pid): v[0] for pid, v in tally.items()}
+
+    if tally:
+        winner, (votes, weight, best) = max(tally.items(), key=lambda item: item[1][1])
+        if votes >= min_agreement * len(rois):
+            return {
+                "status": "ok",
+                "action": "redirect",
+                "patient_id": winner,
+                "message": f"Found {winner}",
+                "confidence": best,
+                "agreement": round(votes / len(rois), 2),
+                **summary
+            }
+    return {"status": "searching", "message": "Unknown", **summary}
+
+# 서버 시작 시, 기존에 학습된 모델이 있다면 미리 메모리에 올립니다.
+load_model()
@@ -0,0 +1,411 @@
+import os
+import sys
+import threading
+import cv2
+import numpy as np
+from config import FACES_DIR, FACE_INDEX_FILE, FACE_THUMB_SIZE, FACE_THUMB_CACHE_SIZE
+from face_pack import FacePack
+from ttl_cache import TTLCache
+
+# ==================================================================
+# [최적화] 환자별 얼굴 이미지 인덱스
+# Faces 폴더 전체를 os.listdir로 훑지 않고, 환자 ID -> 파일 목록을 메모리에 유지합니다.
+# 인덱스는 Faces/.index 에 추가 전용(append-only) 저널로 저장됩니다.
+#   +<TAB>환자ID<TAB>파일명                       : 이미지 추가 (Faces 폴더의 개별 파일)
+#   +<TAB>환자ID<TAB>파일명<TAB>세그먼트:오프셋:길이 : 이미지 추가 (묶음 저장소 face_pack에 저장)
+#   -<TAB>환자ID                                  : 환자 이미지 전체 삭제
+# 다른 프로세스(data_delete.py 등)가 저널에 쓴 내용도 파일 크기를 보고 이어서 반영합니다.
+# 새 이미지는 묶음 저장소에 저장하고, 예전 개별 파일은 --migrate로 옮기기 전까지 그대로 읽습니다.
+# ==================================================================
+
+def _sequence(file_name):
+    """'{pid}_{n}.jpg' 에서 n을 꺼냅니다. (형식이 다르면 -1)"""
+    try:
+        return int(os.path.splitext(file_name)[0].rsplit('_', 1)[1])
+    except (IndexError, ValueError):
+        return -1
+
+def _encode_lines(lines):
+    """저널 줄들을 '\\n'으로 끝나는 UTF-8 바이트로 만듭니다. (운영체제와 관계없이 같은 형식)"""
+    return ''.join(line + '\n' for line in lines).encode('utf-8')
+
+def _format_location(location):
+    return ':'.join(str(v) for v in location)
+
+def _parse_location(text):
+    segment, offset, length = (int(v) for v in text.split(':'))
+    return segment, offset, length
+
+def _sort_key(pid, file_name):
+    """환자ID(숫자 우선) -> 저장 순서. 같은 환자의 이미지가 저장소에서 연속되도록 정렬할 때 사용"""
+    return (0, int(pid), '', _sequence(file_name)) if pid.isdigit() else (1, 0, pid, _sequence(file_name))
+
+class FaceImageIndex:
+    def __init__(self, faces_dir, index_file, pack=None):
+        self.faces_dir = faces_dir
+        self.index_file = index_file
+        self.pack = pack or FacePack()
+        self._lock = threading.RLock()
+        self._images = {}       # 환자ID(str) -> [파일명, ...] (저장 순서)
+        self._locations = {}    # 파일명 -> (세그먼트, 오프셋, 길이) (묶음 저장소에 있는 이미지만)
+        self._next_seq = {}     # 환자ID(str) -> 다음에 사용할 번호
+        self._offset = 0        # 저널에서 읽은 위치
+        self._inode = None      # 저널 파일 식별자 (rebuild로 교체되면 처음부터 다시 읽음)
+        self._loaded = False
+
+    # ---------------- 저널 읽기/쓰기 ----------------
+    def _apply(self, line):
+        parts = line.rstrip('\r\n').split('\t')
+        if parts[0] == '+' and len(parts) in (3, 4):
+            pid, file_name = parts[1], parts[2]
+            files = self._images.setdefault(pid, [])
+            if file_name not in files:
+                files.append(file_name)
+            if len(parts) == 4:
+                self._locations[file_name] = _parse_location(parts[3])
+            else:
+                self._locations.pop(file_name, None)
+            self._next_seq[pid] = max(self._next_seq.get(pid, 0), _sequence(file_name) + 1)
+        elif parts[0] == '-' and len(parts) == 2:
+            for file_name in self._images.pop(parts[1], []):
+                self._locations.pop(file_name, None)
+
+    def _sync(self):
+        """저널에 새로 추가된 줄만 읽어서 반영합니다. (파일이 교체되었으면 처음부터 다시 읽음)"""
+        if not self._loaded:
+            self._loaded = True
+            if not os.path.exists(self.index_file):
+                self.rebuild()
+                return
+        try:
+            st = os.stat(self.index_file)
+        except OSError:
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._images, self._locations, self._next_seq, self._offset = {}, {}, {}, 0
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return
+        # 바이너리로 읽어 오프셋을 실제 바이트 위치와 맞춤 (Windows 텍스트 모드의 \r\n 변환 방지)
+        with open(self.index_file, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        # 다른 프로세스가 쓰는 중인 마지막 줄(개행 없음)은 다음 번에 읽음
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        for line in complete.decode('utf-8').splitlines():
+            self._apply(line)
+        self._offset += len(complete)
+
+    def _append(self, lines):
+        with open(self.index_file, 'ab') as f:
+            f.write(_encode_lines(lines))
+
+    def _entry_line(self, pid, file_name):
+        location = self._locations.get(file_name)
+        if location is None:
+            return f"+\t{pid}\t{file_name}"
+        return f"+\t{pid}\t{file_name}\t{_format_location(location)}"
+
+    def _replace_journal(self, lines):
+        """저널을 lines 내용으로 통째로 교체하고 다시 읽습니다. (임시 파일 후 교체)"""
+        tmp_path = self.index_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_encode_lines(lines))
+        os.replace(tmp_path, self.index_file)
+        self._inode = None
+        self._loaded = True
+        self._sync()
+
+    # ---------------- 조회 ----------------
+    def list_images(self, pid):
+        """환자의 이미지 파일명 목록을 반환합니다. (O(1) 조회)"""
+        with self._lock:
+            self._sync()
+            return list(self._images.get(str(pid), []))
+
+    def count(self, pid):
+        with self._lock:
+            self._sync()
+            return len(self._images.get(str(pid), []))
+
+    def first_image(self, pid):
+        """환자의 대표(가장 먼저 저장된) 이미지 파일명을 반환합니다."""
+        with self._lock:
+            self._sync()
+            files = self._images.get(str(pid))
+            return min(files, key=_sequence) if files else None
+
+    def all_images(self):
+        """{환자ID: [파일명, ...]} 전체 목록의 복사본을 반환합니다."""
+        with self._lock:
+            self._sync()
+            return {pid: list(files) for pid, files in self._images.items() if files}
+
+    def is_packed(self, file_name):
+        with self._lock:
+            self._sync()
+            return file_name in self._locations
+
+    def fingerprint(self, file_name):
+        """이미지가 바뀌었는지 판단하는 값 (저장소 위치 또는 파일 수정시각/크기). 없으면 None."""
+        with self._lock:
+            self._sync()
+            location = self._locations.get(file_name)
+        if location is not None:
+            segment, offset, length = location
+            return (segment << 40) | offset, length
+        try:
+            st = os.stat(os.path.join(self.faces_dir, file_name))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def read_bytes(self, file_name):
+        """이미지(JPEG) 바이트를 반환합니다. 묶음 저장소에 있으면 mmap에서 복사 없이 memoryview로 읽습니다."""
+        with self._lock:
+            self._sync()
+            location = self._locations.get(file_name)
+        if location is not None:
+            return self.pack.read(*location)
+        try:
+            with open(os.path.join(self.faces_dir, file_name), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def read_image(self, file_name):
+        """이미지를 그레이스케일로 디코딩해 반환합니다. (학습용, 읽지 못하면 None)"""
+        data = self.read_bytes(file_name)
+        if data is None or not len(data):
+            return None
+        try:
+            return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        except Exception as e:
+            print(f"❌ 이미지 읽기 실패 ({file_name}): {e}")
+            return None
+
+    # ---------------- 변경 ----------------
+    def reserve_file_name(self, pid):
+        """새 이미지에 사용할 파일명을 예약합니다. (동시 요청끼리 이름이 겹치지 않음)"""
+        with self._lock:
+            self._sync()
+            pid = str(pid)
+            seq = self._next_seq.get(pid, 0)
+            self._next_seq[pid] = seq + 1
+            return f"{pid}_{seq}.jpg"
+
+    def add_image(self, pid, file_name):
+        """Faces 폴더에 저장이 끝난 이미지를 인덱스에 등록합니다."""
+        with self._lock:
+            self._sync()
+            self._append([f"+\t{pid}\t{file_name}"])
+            self._sync()
+
+    def store_image(self, pid, data):
+        """이미지(JPEG) 바이트를 묶음 저장소에 추가하고 인덱스에 등록한 뒤 파일명을 반환합니다."""
+        with self._lock:
+            file_name = self.reserve_file_name(pid)
+            location = self.pack.append(file_name, data)
+            self._append([f"+\t{pid}\t{file_name}\t{_format_location(location)}"])
+            self._sync()
+            return file_name
+
+    def remove_patient(self, pid):
+        """환자의 이미지를 인덱스에서 지우고, 지워진 파일명 목록을 반환합니다."""
+        with self._lock:
+            self._sync()
+            files = list(self._images.get(str(pid), []))
+            self._append([f"-\t{pid}"])
+            self._sync()
+            return files
+
+    def remove_patients(self, pids):
+        """여러 환자의 이미지를 인덱스에서 한 번에 지우고 {환자ID: [파일명, ...]}을 반환합니다."""
+        with self._lock:
+            self._sync()
+            removed = {str(pid): list(self._images.get(str(pid), [])) for pid in pids}
+            self._append([f"-\t{pid}" for pid in removed])
+            self._sync()
+            return removed
+
+    def purge_patients(self, pids):
+        """여러 환자의 이미지를 인덱스와 저장소에서 모두 지우고 지운 이미지 수를 반환합니다.
+
+        묶음 저장소의 이미지는 바로 0으로 덮어쓰고(공간은 --compact 때 회수), 개별 파일은 삭제합니다.
+        """
+        with self._lock:
+            self._sync()
+            packed = {name: self._locations[name] for pid in pids
+                      for name in self._images.get(str(pid), []) if name in self._locations}
+            removed = self.remove_patients(pids)
+        self.pack.scrub(packed.values())
+        deleted = len(packed)
+        for files in removed.values():
+            for file_name in files:
+                if file_name in packed:
+                    continue
+                try:
+                    os.remove(os.path.join(self.faces_dir, file_name))
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"❌ [파일 오류] '{file_name}' 삭제 실패: {e}")
+        return deleted
+
+    def rename_patient(self, old_pid, new_pid):
+        """환자의 이미지를 새 환자 ID로 옮깁니다. (파일명도 '{새ID}_{n}.jpg'로 변경)
+
+        묶음 저장소의 이미지는 바이트를 옮기지 않고 같은 위치를 새 이름으로 저널에 기록합니다.
+        """
+        with self._lock:
+            self._sync()
+            moved, lines = [], [f"-\t{old_pid}"]
+            for file_name in self._images.get(str(old_pid), []):
+                new_name = self.reserve_file_name(new_pid)
+                location = self._locations.get(file_name)
+                if location is not None:
+                    lines.append(f"+\t{new_pid}\t{new_name}\t{_format_location(location)}")
+                else:
+                    try:
+                        os.replace(os.path.join(self.faces_dir, file_name), os.path.join(self.faces_dir, new_name))
+                    except FileNotFoundError:
+                        continue
+                    lines.append(f"+\t{new_pid}\t{new_name}")
+                moved.append(new_name)
+            self._append(lines)
+            self._sync()
+            return moved
+
+    def rebuild(self):
+        """Faces 폴더를 한 번만 훑어서 인덱스를 새로 만들고 저널을 압축합니다. (묶음 저장소 항목은 유지)"""
+        with self._lock:
+            packed = []
+            if os.path.exists(self.index_file):
+                self._loaded = True
+                self._sync()
+                packed = [self._entry_line(pid, name) for pid, files in self._images.items()
+                          for name in files if name in self._locations]
+            images = {}
+            if os.path.exists(self.faces_dir):
+                with os.scandir(self.faces_dir) as it:
+                    for entry in it:
+                        name = entry.name
+                        if name.startswith('.') or '_' not in name or not entry.is_file():
+                            continue
+                        images.setdefault(name.split('_', 1)[0], []).append(name)
+            lines = list(packed)
+            for pid, files in images.items():
+                files.sort(key=_sequence)
+                lines.extend(f"+\t{pid}\t{name}" for name in files)
+
+            self._replace_journal(lines)
+            print(f"[INDEX] 얼굴 이미지 인덱스 재생성: 묶음 저장소 {len(packed)}장, Faces 폴더 {len(lines) - len(packed)}장")
+            return len(lines)
+
+    def migrate(self):
+        """Faces 폴더의 개별 이미지 파일을 묶음 저장소로 옮깁니다. (환자별로 연속 저장, 파일명 유지)"""
+        with self._lock:
+            self._sync()
+            loose = sorted(((pid, name) for pid, files in self._images.items()
+                            for name in files if name not in self._locations),
+                           key=lambda item: _sort_key(*item))
+            lines, moved = [], []
+            for pid, file_name in loose:
+                path = os.path.join(self.faces_dir, file_name)
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError as e:
+                    print(f"⚠️ 이미지 읽기 실패, 건너뜀 ({file_name}): {e}")
+                    continue
+                lines.append(f"+\t{pid}\t{file_name}\t{_format_location(self.pack.append(file_name, data))}")
+                moved.append(path)
+            # 저널에 새 위치가 기록된 뒤에 원본 파일 삭제
+            self._append(lines)
+            self._sync()
+            for path in moved:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"⚠️ 원본 파일 삭제 실패 ({path}): {e}")
+            print(f"[INDEX] 묶음 저장소로 이동: {len(moved)}장 / {len(loose)}장")
+            return len(moved)
+
+    def compact(self):
+        """묶음 저장소를 살아 있는 이미지만 환자 순서대로 새 세그먼트에 다시 쓰고 이전 세그먼트를 지웁니다.
+
+        삭제된 이미지 공간을 회수하고, 환자 1명의 이미지가 한 곳에 모이게 합니다. (서버를 멈춘 상태에서 실행)
+        """
+        with self._lock:
+            self._sync()
+            before = self.pack.size()
+            entries = sorted(((pid, name) for pid, files in self._images.items() for name in files),
+                             key=lambda item: _sort_key(*item))
+            packed = [(pid, name) for pid, name in entries if name in self._locations]
+            first_segment, locations = self.pack.rewrite(
+                (name, self.pack.read(*self._locations[name]) or b'') for _, name in packed)
+            self._locations.update(locations)
+            self._replace_journal([self._entry_line(pid, name) for pid, name in entries])
+            self.pack.remove_segments(first_segment)
+            print(f"[INDEX] 묶음 저장소 정리: 이미지 {len(packed)}장, {before:,} -> {self.pack.size():,} 바이트")
+            return len(packed)
+
+_face_index = None
+_face_index_lock = threading.Lock()
+
+def get_face_index():
+    """얼굴 이미지 인덱스를 반환합니다 (싱글톤 패턴)"""
+    global _face_index
+    with _face_index_lock:
+        if _face_index is None:
+            _face_index = FaceImageIndex(FACES_DIR, FACE_INDEX_FILE)
+    return _face_index
+
+# ==================================================================
+# [최적화] /face_image 썸네일 캐시
+# 대표 이미지를 요청마다 파일에서 읽어 원본 그대로 보내지 않고, 축소한 JPEG를 메모리에 보관합니다.
+# 키에 이미지 위치(fingerprint)가 들어가므로 이미지가 바뀌면 자동으로 새로 만듭니다.
+# ==================================================================
+_thumbnails = TTLCache(FACE_THUMB_CACHE_SIZE, 24 * 3600)
+
+def get_face_thumbnail(pid):
+    """환자 대표 이미지의 썸네일 (ETag, JPEG 바이트)를 반환합니다. 없으면 None."""
+    face_index = get_face_index()
+    file_name = face_index.first_image(pid)
+    fingerprint = face_index.fingerprint(file_name) if file_name else None
+    if fingerprint is None:
+        return None
+    etag = f"{file_name}-{fingerprint[0]:x}-{fingerprint[1]:x}"
+    cached = _thumbnails.get(etag)
+    if cached is not None:
+        return etag, cached
+    img = face_index.read_image(file_name)
+    if img is None:
+        return None
+    scale = FACE_THUMB_SIZE / max(img.shape[:2])
+    if scale < 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if not ok:
+        return None
+    data = encoded.tobytes()
+    _thumbnails.set(etag, data)
+    return etag, data
+
+def get_thumbnail_stats():
+    return _thumbnails.get_stats()
+
+if __name__ == "__main__":
+    # 사용법: python face_store.py --rebuild   (Faces 폴더를 다시 스캔하여 인덱스 재생성)
+    #         python face_store.py --migrate   (Faces 폴더의 개별 이미지를 묶음 저장소로 이동)
+    #         python face_store.py --compact   (묶음 저장소의 삭제된 공간 회수 + 환자별 정렬, 서버 중지 후 실행)
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == '--rebuild':
+        get_face_index().rebuild()
+    elif command == '--migrate':
+        get_face_index().migrate()
+    elif command == '--compact':
+        get_face_index().compact()
+    else:
+        print("💡 사용법: python face_store.py [--rebuild | --migrate | --compact]")
@@ -0,0 +1,264 @@
+import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from numpy.lib.format import open_memmap
+from config import FACES_DIR, FEATURE_CACHE_DIR, TRAIN_WORKERS, TRAIN_CHUNK_SIZE
+from lbph_index import FEATURE_DIM, lbph_histogram
+from vision_pool import get_vision_pool, PRIORITY_TRAIN
+
+# ==================================================================
+# [최적화] 얼굴 이미지 LBPH 특징 캐시
+# 학습할 때마다 모든 JPEG를 다시 디코딩하지 않도록, 이미지별 LBPH 히스토그램을
+# 메모리 매핑된 .npy 행렬에 저장해 둡니다. (키: 파일명 + 변경 확인값(수정시각/크기 또는 저장소 위치/길이))
+#   feature_cache/features-<세대>.npy : (용량, FEATURE_DIM) float32 행렬
+#   feature_cache/features.json       : 세대, 사용 중인 행 수, {파일명: [행, 변경 확인값 2개]}
+# 행렬이 가득 차거나 압축할 때는 새 세대 파일을 만들어 교체하므로,
+# 이전 세대를 보고 있는 식별용 인덱스는 학습 중에도 그대로 유효합니다.
+# ==================================================================
+_INITIAL_CAPACITY = 256
+
+def is_contiguous(rows):
+    """행 번호가 빈틈 없이 연속으로 증가하는지 확인합니다. (memmap 조각으로 바로 쓸 수 있는지)"""
+    return all(b == a + 1 for a, b in zip(rows, rows[1:]))
+
+class FeatureCache:
+    def __init__(self, cache_dir, faces_dir=FACES_DIR, workers=TRAIN_WORKERS, chunk_size=TRAIN_CHUNK_SIZE):
+        self.cache_dir = cache_dir
+        self.faces_dir = faces_dir
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.last_load_stats = None
+        self.meta_path = os.path.join(cache_dir, 'features.json')
+        self._lock = threading.RLock()
+        self._entries = {}      # 파일명 -> (행, 변경 확인값 2개)
+        self._count = 0         # 사용 중인 행 수
+        self._generation = 0
+        self._data = None       # 현재 세대 memmap
+        self._loaded = False
+
+    def _data_path(self, generation):
+        return os.path.join(self.cache_dir, f'features-{generation}.npy')
+
+    # ---------------- 로드/저장 ----------------
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            data = np.load(self._data_path(meta['generation']), mmap_mode='r+')
+            if data.shape[1] != FEATURE_DIM or data.shape[0] < meta['count']:
+                raise ValueError(f"캐시 형식 불일치: {data.shape}")
+        except Exception as e:
+            print(f"⚠️ 특징 캐시 읽기 실패 (새로 만듭니다): {e}")
+            return
+        self._generation = meta['generation']
+        self._count = meta['count']
+        self._entries = {name: tuple(v) for name, v in meta['files'].items()}
+        self._data = data
+
+    def _save_meta(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": 1, "dim": FEATURE_DIM, "generation": self._generation,
+                "count": self._count, "files": {name: list(v) for name, v in self._entries.items()},
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+        # 메타 파일이 새 세대를 가리키게 된 뒤에 이전 세대 파일을 정리
+        self._remove_old_generations()
+
+    def _new_generation(self, capacity, rows=None):
+        """새 세대 파일을 만들고 (rows가 주어지면 그 행들만 순서대로) 기존 데이터를 옮깁니다."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        old_data, old_generation = self._data, self._generation
+        data = open_memmap(self._data_path(old_generation + 1), mode='w+',
+                           dtype=np.float32, shape=(capacity, FEATURE_DIM))
+        if old_data is not None:
+            if rows is None:
+                data[:self._count] = old_data[:self._count]
+            else:
+                for i in range(0, len(rows), 1024):
+                    chunk = rows[i:i + 1024]
+                    data[i:i + len(chunk)] = old_data[chunk]
+        self._data, self._generation = data, old_generation + 1
+
+    def _remove_old_generations(self):
+        current = os.path.basename(self._data_path(self._generation))
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('features-') and name.endswith('.npy') and name != current:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    # Windows에서는 다른 곳에서 매핑 중이면 지울 수 없으므로 다음 기회에 정리
+                    pass
+
+    def _append(self, hist):
+        if self._data is None or self._count >= self._data.shape[0]:
+            capacity = max(_INITIAL_CAPACITY, 2 * (self._data.shape[0] if self._data is not None else 0))
+            self._new_generation(capacity)
+        row = self._count
+        self._data[row] = hist
+        self._count += 1
+        return row
+
+    # ---------------- 조회 ----------------
+    def lookup(self, file_name, fingerprint=None):
+        """캐시된 행 번호를 반환합니다. fingerprint가 주어지면 변경 확인값까지 일치해야 합니다."""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(file_name)
+            if entry is None:
+                return None
+            if fingerprint is not None and (entry[1], entry[2]) != tuple(fingerprint):
+                return None
+            return entry[0]
+
+    def _stat_fingerprint(self, file_name):
+        """Faces 폴더 파일의 (수정시각, 크기). 없으면 None"""
+        try:
+            st = os.stat(os.path.join(self.faces_dir, file_name))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def features(self, rows):
+        """행 번호 목록에 해당하는 특징 행렬을 반환합니다.
+
+        rows가 연속된 구간이면 memmap 조각을 그대로 돌려주므로 복사가 일어나지 않습니다.
+        """
+        with self._lock:
+            self._load()
+            rows = np.asarray(rows, dtype=np.int64)
+            if rows.size and np.array_equal(rows, np.arange(rows[0], rows[0] + rows.size)):
+                return self._data[rows[0]:rows[0] + rows.size]
+            if not rows.size:
+                return np.empty((0, FEATURE_DIM), dtype=np.float32)
+            return self._data[rows]
+
+    # ---------------- 갱신 ----------------
+    def update(self, file_names, read_image, progress=None, fingerprint=None):
+        """파일별 특징 행 번호를 반환합니다. 새로 생기거나 바뀐 이미지만 디코딩합니다.
+
+        read_image(파일명)은 그레이스케일 이미지를, fingerprint(파일명)은 변경 확인값 2개를 반환합니다.
+        (fingerprint를 주지 않으면 Faces 폴더 파일의 수정시각/크기 사용) 읽지 못한 파일은 결과에서 None 입니다.
+        """
+        fingerprint = fingerprint or self._stat_fingerprint
+        with self._lock:
+            self._load()
+            rows = [None] * len(file_names)
+            pending = []
+            for i, file_name in enumerate(file_names):
+                fp = fingerprint(file_name)
+                if fp is None:
+                    continue
+                row = self.lookup(file_name, fp)
+                if row is None:
+                    pending.append((i, file_name, fp))
+                else:
+                    rows[i] = row
+
+            self._extract_pending(pending, rows, read_image, progress)
+
+            if pending and self._data is not None:
+                self._data.flush()
+                self._save_meta()
+            return rows
+
+    def _extract_pending(self, pending, rows, read_image, progress):
+        """[최적화] 이미지 디코딩 + 특징 추출을 스레드 풀에서 병렬로 수행합니다.
+
+        cv2.imdecode와 NumPy 연산은 대부분 GIL을 풀고 실행되므로 스레드로도 여러 코어를 씁니다.
+        실제 계산은 영상 처리 작업 풀에서 가장 낮은 우선순위로 실행되므로, 학습 중에도 식별 요청이 먼저 처리됩니다.
+        (동시에 풀에 넣는 이미지는 작업자 수(workers)개까지)
+        chunk_size 장씩 끊어서 처리하고 결과를 바로 memmap에 기록하므로,
+        메모리 사용량은 전체 이미지 수가 아니라 chunk 크기에만 비례합니다.
+        """
+        total = len(pending)
+        if not total:
+            return
+
+        def extract(file_name):
+            img = read_image(file_name)
+            if img is None:
+                return None
+            try:
+                return lbph_histogram(img)
+            except ValueError as e:
+                print(f"⚠️ 특징 추출 실패 ({file_name}): {e}")
+                return None
+
+        vision = get_vision_pool()
+
+        def extract_in_pool(file_name):
+            return vision.run(PRIORITY_TRAIN, extract, file_name, shed=False)
+
+        started = time.perf_counter()
+        done = 0
+        # 첫 묶음이 끝나기 전에 알려야 진행률 계산의 시작 시각이 실제 시작과 맞음
+        if progress:
+            progress("loading", 0, total)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="feature-load") as pool:
+            for start in range(0, total, self.chunk_size):
+                chunk = pending[start:start + self.chunk_size]
+                hists = pool.map(extract_in_pool, [file_name for _, file_name, _ in chunk])
+                for (i, file_name, fp), hist in zip(chunk, hists):
+                    if hist is not None:
+                        rows[i] = self._append(hist)
+                        self._entries[file_name] = (rows[i], fp[0], fp[1])
+                done += len(chunk)
+                if progress:
+                    progress("loading", done, total)
+
+        elapsed = time.perf_counter() - started
+        self.last_load_stats = {
+            "images": total, "seconds": round(elapsed, 3),
+            "images_per_sec": round(total / elapsed, 1) if elapsed > 0 else None,
+            "workers": self.workers,
+        }
+        print(f"[CACHE] 이미지 {total}장 특징 추출: {elapsed:.2f}초 "
+              f"({self.last_load_stats['images_per_sec']}장/초, 작업자 {self.workers}개)")
+
+    def compact(self, keep_rows):
+        """keep_rows 행만 순서대로 남기고 나머지(삭제/변경된 이미지)를 정리합니다.
+
+        새 행 번호 목록(0부터 연속)을 반환합니다.
+        """
+        with self._lock:
+            self._load()
+            keep_rows = [int(r) for r in keep_rows]
+            new_row = {old: new for new, old in enumerate(keep_rows)}
+            self._new_generation(max(_INITIAL_CAPACITY, len(keep_rows)), keep_rows)
+            self._entries = {name: (new_row[e[0]], e[1], e[2]) for name, e in self._entries.items() if e[0] in new_row}
+            self._count = len(keep_rows)
+            self._data.flush()
+            self._save_meta()
+            print(f"[CACHE] 특징 캐시 정리: {len(keep_rows)}행 유지")
+            return list(range(len(keep_rows)))
+
+    def clear(self):
+        """캐시를 비웁니다. (다음 학습 때 모든 이미지를 다시 디코딩)"""
+        with self._lock:
+            self._load()
+            # 식별용 인덱스가 보고 있을 수 있는 기존 행은 덮어쓰지 않고 새 세대에서 시작
+            self._entries, self._count = {}, 0
+            self._new_generation(_INITIAL_CAPACITY)
+            self._save_meta()
+
+_feature_cache = None
+_feature_cache_lock = threading.Lock()
+
+def get_feature_cache():
+    """특징 캐시를 반환합니다 (싱글톤 패턴)"""
+    global _feature_cache
+    with _feature_cache_lock:
+        if _feature_cache is None:
+            _feature_cache = FeatureCache(FEATURE_CACHE_DIR)
+    return _feature_cache
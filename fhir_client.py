@@ -0,0 +1,200 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (FHIR_SERVER_URL, FHIR_POOL_SIZE, FHIR_MAX_CONCURRENT, FHIR_CONNECT_TIMEOUT,
+                    FHIR_READ_TIMEOUT, FHIR_RETRIES, FHIR_RETRY_BACKOFF,
+                    FHIR_BREAKER_THRESHOLD, FHIR_BREAKER_RESET,
+                    FHIR_PATIENT_CACHE_SIZE, FHIR_PATIENT_CACHE_TTL)
+from ttl_cache import TTLCache
+import metrics
+
+# ==================================================================
+# [최적화] 공용 FHIR HTTP 클라이언트
+# 요청마다 requests.get/post로 새 TCP 연결을 여는 대신 keep-alive 커넥션 풀을 재사용합니다.
+#   - 조회(GET/HEAD)는 연결 오류/5xx 시 지수 백오프로 재시도 (POST는 연결 자체가 안 된 경우만)
+#   - 동시 요청 수 제한: FHIR 서버가 느려도 Flask 작업 스레드가 전부 묶이지 않도록 대기 시간 제한
+#   - 서킷 브레이커: 연속 실패가 쌓이면 일정 시간 즉시 실패시켜 타임아웃 대기를 없앰
+# ==================================================================
+class FHIRUnavailable(requests.ConnectionError):
+    """서킷이 열려 있거나 동시 요청 한도를 넘어 FHIR 요청을 보내지 않은 경우"""
+
+class FHIRClient:
+    def __init__(self, base_url=FHIR_SERVER_URL, pool_size=FHIR_POOL_SIZE, max_concurrent=FHIR_MAX_CONCURRENT,
+                 timeout=(FHIR_CONNECT_TIMEOUT, FHIR_READ_TIMEOUT), retries=FHIR_RETRIES,
+                 backoff=FHIR_RETRY_BACKOFF, failure_threshold=FHIR_BREAKER_THRESHOLD,
+                 reset_timeout=FHIR_BREAKER_RESET):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'HEAD']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._failures = 0          # 연속 실패 횟수
+        self._opened_at = None      # 서킷이 열린 시각 (None = 닫힘)
+        self._trial = False         # 반열림 상태에서 시험 요청이 진행 중인지
+        self._stats = {"requests": 0, "errors": 0, "rejected": 0, "circuit_opened": 0}
+
+    # ---------------- 서킷 브레이커 ----------------
+    def _allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # 재시도 시간이 지나면 요청 1개만 통과시켜 서버 회복 여부를 확인 (반열림)
+            if time.time() - self._opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def _on_result(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                if self._opened_at is not None:
+                    print("[FHIR] 서버 응답 회복: 서킷 닫힘")
+                self._failures, self._opened_at = 0, None
+                return
+            self._stats["errors"] += 1
+            self._failures += 1
+            if self._failures >= self.failure_threshold and (
+                    self._opened_at is None or time.time() - self._opened_at >= self.reset_timeout):
+                if self._opened_at is None:
+                    self._stats["circuit_opened"] += 1
+                    print(f"⚠️ [FHIR] 연속 {self._failures}회 실패: {self.reset_timeout}초 동안 요청 차단")
+                self._opened_at = time.time()
+
+    def _release_trial(self):
+        # 시험 요청이 보내지지 못했으면 다음 요청이 다시 시험할 수 있도록 되돌림
+        with self._lock:
+            self._trial = False
+
+    def _reject(self, reason):
+        with self._lock:
+            self._stats["rejected"] += 1
+        raise FHIRUnavailable(reason)
+
+    # ---------------- 요청 ----------------
+    def request(self, method, path, **kwargs):
+        """FHIR 서버에 요청을 보냅니다. path는 '/Patient/1' 처럼 서버 기준 경로입니다."""
+        if not self._allow():
+            self._reject("FHIR 서버 응답 없음 (잠시 후 다시 시도)")
+        # 동시 요청 한도: 연결 타임아웃만큼만 빈 자리를 기다림
+        connect_timeout = self.timeout[0] if isinstance(self.timeout, tuple) else self.timeout
+        if not self._slots.acquire(timeout=connect_timeout):
+            self._release_trial()
+            self._reject("FHIR 요청이 많아 처리할 수 없습니다.")
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                self._stats["requests"] += 1
+            kwargs.setdefault('timeout', self.timeout)
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException:
+            metrics.fhir_request_seconds.observe(time.perf_counter() - started, method, "error")
+            self._on_result(False)
+            raise
+        except Exception:
+            # 잘못된 URL/헤더 등 요청을 만들다 난 오류는 서버 장애로 세지 않되, 시험 요청 표시는 반드시 되돌림
+            metrics.fhir_request_seconds.observe(time.perf_counter() - started, method, "error")
+            self._release_trial()
+            raise
+        finally:
+            self._slots.release()
+        metrics.fhir_request_seconds.observe(time.perf_counter() - started, method, f"{response.status_code // 100}xx")
+        self._on_result(response.status_code < 500)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def get_stats(self):
+        """요청/오류/거절 횟수와 서킷 상태를 반환합니다."""
+        with self._lock:
+            return {**self._stats, "circuit": "open" if self._opened_at is not None else "closed",
+                    "circuit_open": self._opened_at is not None, "consecutive_failures": self._failures}
+
+# ==================================================================
+# [최적화] FHIR Patient 리소스 캐시 (ETag 재검증)
+# 식별 직후 /check_patient_id(이름 확인)와 환자 화면의 /api/proxy/patient가
+# 같은 Patient 리소스를 연달아 가져오므로, 응답 본문을 LRU+TTL 캐시에 보관합니다.
+# 만료된 항목은 If-None-Match(ETag) / If-Modified-Since로 재검증하여 바뀌지 않았으면(304) 본문을 재사용하고,
+# FHIR 서버가 응답하지 않으면 만료된 본문이라도 돌려줍니다.
+# ==================================================================
+class PatientCache:
+    def __init__(self, client_getter, capacity=FHIR_PATIENT_CACHE_SIZE, ttl=FHIR_PATIENT_CACHE_TTL):
+        self._client = client_getter
+        self.cache = TTLCache(capacity, ttl)
+        self._lock = threading.Lock()
+        self._stats = {"revalidated": 0, "stale_served": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def fetch(self, pid, **kwargs):
+        """Patient/{pid}를 (상태 코드, JSON 본문 bytes)로 반환합니다."""
+        key = str(pid)
+        entry = self.cache.get_entry(key)
+        if entry is not None and entry[1]:
+            return 200, entry[0][2]
+
+        headers = {}
+        if entry is not None:
+            etag, last_modified, _ = entry[0]
+            if etag:
+                headers['If-None-Match'] = etag
+            elif last_modified:
+                headers['If-Modified-Since'] = last_modified
+        try:
+            r = self._client().get(f"/Patient/{key}", headers=headers, **kwargs)
+        except requests.RequestException:
+            if entry is None:
+                raise
+            self._count("stale_served")
+            return 200, entry[0][2]
+
+        if r.status_code == 304 and entry is not None:
+            self.cache.set(key, entry[0])
+            self._count("revalidated")
+            return 200, entry[0][2]
+        if r.status_code == 200:
+            self.cache.set(key, (r.headers.get('ETag'), r.headers.get('Last-Modified'), r.content))
+        elif r.status_code in (404, 410):
+            self.cache.invalidate(key)
+        return r.status_code, r.content
+
+    def invalidate(self, pid):
+        self.cache.invalidate(str(pid))
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.cache.get_stats(), **self._stats}
+
+_fhir_client = None
+_fhir_client_lock = threading.Lock()
+
+def get_fhir_client():
+    """공용 FHIR 클라이언트를 반환합니다 (싱글톤 패턴)"""
+    global _fhir_client
+    with _fhir_client_lock:
+        if _fhir_client is None:
+            _fhir_client = FHIRClient()
+    return _fhir_client
+
+patient_cache = PatientCache(get_fhir_client)
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import uuid
+import threading
+from config import (FHIR_OUTBOX_FILE, FHIR_OUTBOX_BATCH_SIZE, FHIR_OUTBOX_FLUSH_INTERVAL,
+                    FHIR_OUTBOX_MAX_BACKOFF, LOCAL_ID_BASE, LOCAL_ID_SYSTEM)
+import db_manager
+from fhir_client import get_fhir_client, patient_cache
+from face_store import get_face_index
+
+# ==================================================================
+# [최적화] FHIR 환자 생성 지연 전송 (write-behind outbox)
+# /create_fhir_patient가 FHIR 서버 응답을 기다리지 않도록, Patient 리소스를 로컬 저널에 먼저 기록하고
+# 임시 로컬 ID(LOCAL_ID_BASE 이상)를 바로 돌려줍니다. 백그라운드 스레드가 모아서 전송하며
+# (transaction Bundle, 미지원 서버는 1건씩), 서버가 ID를 주면 DB/얼굴 이미지의 환자 ID를 바꿉니다.
+#
+# 저널(fhir_outbox.jsonl, 한 줄 = JSON 1개, 추가 전용):
+#   {"op": "queued", "local_id", "resource"}      전송 대기 등록
+#   {"op": "created", "local_id", "fhir_id"}       FHIR 서버가 ID 부여
+#   {"op": "reconciled", "local_id"}               로컬 DB/이미지 ID 교체 완료
+# 리소스에는 로컬 ID 식별자를 붙여 조건부 생성(If-None-Exist)하므로,
+# 전송 직후 서버가 죽어 다시 보내더라도 환자가 두 번 만들어지지 않습니다.
+# ==================================================================
+_UNSUPPORTED = (404, 405, 501)
+_REJECTED = object()    # transaction Bundle이 4xx로 거절됨 (1건씩 다시 보내 원인 확인)
+
+def _entry_patient_id(entry):
+    """transaction 응답 항목에서 생성된 Patient ID를 꺼냅니다. (location 또는 resource.id, 없으면 None)"""
+    location = (entry.get('response') or {}).get('location') or ''
+    if 'Patient/' in location:
+        fhir_id = location.split('Patient/')[-1].split('/')[0]
+        if fhir_id:
+            return fhir_id
+    fhir_id = (entry.get('resource') or {}).get('id')
+    return str(fhir_id) if fhir_id not in (None, '', 'Unknown') else None
+
+class FHIROutbox:
+    def __init__(self, path=FHIR_OUTBOX_FILE, batch_size=FHIR_OUTBOX_BATCH_SIZE,
+                 flush_interval=FHIR_OUTBOX_FLUSH_INTERVAL, max_backoff=FHIR_OUTBOX_MAX_BACKOFF):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._items = {}        # 로컬 ID -> {"resource", "fhir_id", "attempts", "next_try", "error"}
+        self._resolved = {}     # 로컬 ID -> FHIR ID (교체 완료)
+        self._next_id = LOCAL_ID_BASE + 1
+        self._bundles = True    # 서버가 transaction Bundle을 지원하는지
+        self._bundles_paused_until = 0.0    # 묶음 전송이 실패해 1건씩 보내는 기간 (이 시각까지)
+        self._stats = {"queued": 0, "sent": 0, "failed_attempts": 0, "bundles": 0}
+        self._load()
+
+    # ---------------- 저널 ----------------
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue    # 쓰다가 끊긴 마지막 줄
+                self._apply(rec)
+        if self._items:
+            print(f"[OUTBOX] 전송 대기 중인 환자 {len(self._items)}명 복구")
+
+    def _apply(self, rec):
+        local_id = rec.get('local_id')
+        op = rec.get('op')
+        if op == 'queued':
+            self._items[local_id] = {"resource": rec['resource'], "fhir_id": None,
+                                     "attempts": 0, "next_try": 0, "error": None}
+            self._next_id = max(self._next_id, local_id + 1)
+        elif op == 'created' and local_id in self._items:
+            self._items[local_id]["fhir_id"] = rec['fhir_id']
+        elif op in ('reconciled', 'mapped'):
+            fhir_id = rec.get('fhir_id') or self._items.get(local_id, {}).get('fhir_id')
+            self._items.pop(local_id, None)
+            self._resolved[local_id] = fhir_id
+            self._next_id = max(self._next_id, local_id + 1)
+
+    def _write(self, records):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(rec, ensure_ascii=False) + '\n' for rec in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _compact(self):
+        """대기 항목이 없으면 저널을 ID 대응표만 남기고 다시 씁니다. (환자 정보 원문 정리)"""
+        if self._items:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for local_id, fhir_id in self._resolved.items():
+                f.write(json.dumps({"op": "mapped", "local_id": local_id, "fhir_id": fhir_id}) + '\n')
+        os.replace(tmp_path, self.path)
+
+    # ---------------- 등록/조회 ----------------
+    def enqueue(self, resource):
+        """Patient 리소스를 전송 대기열에 넣고 임시 로컬 ID를 반환합니다."""
+        with self._lock:
+            local_id = self._next_id
+            self._next_id += 1
+            resource = dict(resource)
+            resource["identifier"] = list(resource.get("identifier", [])) + [
+                {"system": LOCAL_ID_SYSTEM, "value": str(local_id)}]
+            self._write([{"op": "queued", "local_id": local_id, "resource": resource, "at": time.time()}])
+            self._apply({"op": "queued", "local_id": local_id, "resource": resource})
+            self._stats["queued"] += 1
+        self.start()
+        self._wake.set()
+        return local_id
+
+    def resolve(self, pid):
+        """로컬 ID에 FHIR ID가 부여되었으면 FHIR ID를, 아니면 None을 반환합니다.
+
+        로컬 데이터 교체 전이라도 FHIR ID를 돌려주므로, 그 사이 들어온 요청(얼굴 등록 등)은
+        처음부터 FHIR ID로 저장되고 남은 데이터는 _reconcile()이 옮깁니다.
+        """
+        try:
+            local_id = int(pid)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            item = self._items.get(local_id)
+            return item["fhir_id"] if item is not None else self._resolved.get(local_id)
+
+    def pending_resource(self, pid):
+        """아직 전송되지 않은 환자의 리소스(로컬 ID 포함)를 반환합니다. 없으면 None."""
+        try:
+            local_id = int(pid)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            item = self._items.get(local_id)
+            return dict(item["resource"], id=str(local_id)) if item else None
+
+    def get_stats(self):
+        with self._lock:
+            return {**self._stats, "pending": len(self._items),
+                    "mode": "bundle" if self._use_bundles() else "single",
+                    "oldest_error": next((i["error"] for i in self._items.values() if i["error"]), None)}
+
+    # ---------------- 전송 ----------------
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="fhir-outbox", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                while self.flush_once():
+                    pass
+            except Exception as e:
+                print(f"⚠️ [OUTBOX] 전송 처리 오류: {e}")
+
+    def _due(self):
+        now = time.time()
+        with self._lock:
+            due = [(local_id, item) for local_id, item in self._items.items() if item["next_try"] <= now]
+        return due[:self.batch_size]
+
+    def flush_once(self):
+        """전송할 차례인 항목을 한 묶음 처리합니다. 처리한 항목 수를 반환합니다."""
+        batch = self._due()
+        if not batch:
+            return 0
+        unsent = [(local_id, item) for local_id, item in batch if item["fhir_id"] is None]
+        if unsent:
+            created = self._send_bundle(unsent) if self._use_bundles() and len(unsent) > 1 else None
+            if created is _REJECTED:
+                created = self._send_each(unsent)
+                if len(created) == len(unsent):
+                    # 1건씩은 모두 성공: 특정 환자 문제가 아니라 서버가 묶음을 받지 않는 것
+                    self._pause_bundles("transaction Bundle 거절 (1건씩은 모두 성공)")
+            elif created is None:
+                created = self._send_each(unsent)
+            if created:
+                self._write([{"op": "created", "local_id": local_id, "fhir_id": fhir_id}
+                             for local_id, fhir_id in created.items()])
+                with self._lock:
+                    for local_id, fhir_id in created.items():
+                        self._items[local_id]["fhir_id"] = fhir_id
+                    self._stats["sent"] += len(created)
+
+        for local_id, item in batch:
+            if item["fhir_id"] is not None:
+                self._reconcile(local_id, item)
+        with self._lock:
+            if not self._items:
+                self._compact()
+        return len(batch)
+
+    def _fail(self, local_id, error):
+        with self._lock:
+            item = self._items[local_id]
+            item["attempts"] += 1
+            item["error"] = error
+            item["next_try"] = time.time() + min(self.max_backoff, 2 ** item["attempts"])
+            self._stats["failed_attempts"] += 1
+
+    def _use_bundles(self):
+        return self._bundles and time.time() >= self._bundles_paused_until
+
+    def _pause_bundles(self, reason):
+        """묶음 전송을 max_backoff초 동안 쉬고 1건씩 보냅니다. (매번 실패할 묶음을 먼저 보내지 않음)"""
+        self._bundles_paused_until = time.time() + self.max_backoff
+        print(f"[OUTBOX] {reason}: {self.max_backoff}초 동안 1건씩 전송")
+
+    def _send_bundle(self, items):
+        """transaction Bundle 하나로 전송합니다.
+
+        {로컬 ID: FHIR ID}, None(1건씩 재전송 필요) 또는 _REJECTED(4xx 거절, 1건씩 재전송 후 원인 판단)를 반환합니다.
+        """
+        bundle = {"resourceType": "Bundle", "type": "transaction", "entry": [
+            {"fullUrl": f"urn:uuid:{uuid.uuid4()}", "resource": item["resource"],
+             "request": {"method": "POST", "url": "Patient",
+                         "ifNoneExist": f"identifier={LOCAL_ID_SYSTEM}|{local_id}"}}
+            for local_id, item in items]}
+        try:
+            r = get_fhir_client().post("", json=bundle)
+        except Exception as e:
+            for local_id, _ in items:
+                self._fail(local_id, str(e))
+            return {}
+        if r.status_code in _UNSUPPORTED:
+            print(f"[OUTBOX] FHIR 서버가 transaction Bundle을 지원하지 않음 ({r.status_code}): 1건씩 전송")
+            self._bundles = False
+            return None
+        if r.status_code >= 500:
+            for local_id, _ in items:
+                self._fail(local_id, f"Server Error {r.status_code}")
+            return {}
+        if r.status_code not in (200, 201):
+            # 묶음 중 한 건이 거절되면 전체가 취소되므로, 이번 묶음은 1건씩 다시 보내 원인을 분리
+            return _REJECTED
+        try:
+            entries = r.json().get('entry', [])
+            if len(entries) != len(items):
+                print(f"⚠️ [OUTBOX] transaction Bundle 응답 항목 수 불일치 (보냄 {len(items)}, 받음 {len(entries)})")
+            created = {}
+            for (local_id, _), entry in zip(items, entries):
+                fhir_id = _entry_patient_id(entry)
+                if fhir_id:
+                    created[local_id] = fhir_id
+        except (ValueError, AttributeError):
+            # 성공 응답인데 결과를 읽을 수 없음: 조건부 생성이라 1건씩 다시 보내도 중복 생성은 없음
+            self._pause_bundles("transaction Bundle 응답을 해석할 수 없음")
+            return None
+        with self._lock:
+            self._stats["bundles"] += 1
+        # FHIR ID를 알 수 없는 항목(응답 누락 포함)은 1건씩 다시 보냄 (ifNoneExist라 중복 생성 없음)
+        missing = [(local_id, item) for local_id, item in items if local_id not in created]
+        if missing:
+            created.update(self._send_each(missing))
+        return created
+
+    def _send_each(self, items):
+        created = {}
+        for local_id, item in items:
+            success, result = db_manager.send_to_fhir_server(
+                item["resource"], if_none_exist=f"identifier={LOCAL_ID_SYSTEM}|{local_id}")
+            if success and result.get("id") not in (None, "Unknown"):
+                created[local_id] = result["id"]
+            else:
+                self._fail(local_id, result.get("message"))
+        return created
+
+    def _reconcile(self, local_id, item):
+        """로컬 DB와 얼굴 이미지의 환자 ID를 FHIR ID로 바꿉니다."""
+        fhir_id = item["fhir_id"]
+        success, msg = db_manager.rename_patient(local_id, fhir_id)
+        if not success:
+            self._fail(local_id, msg)
+            return
+        get_face_index().rename_patient(local_id, fhir_id)
+        patient_cache.invalidate(local_id)
+        self._write([{"op": "reconciled", "local_id": local_id}])
+        with self._lock:
+            self._apply({"op": "reconciled", "local_id": local_id, "fhir_id": fhir_id})
+        print(f"[OUTBOX] 임시 ID {local_id} -> FHIR ID {fhir_id} 교체 완료")
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_fhir_outbox():
+    """FHIR 전송 대기열을 반환합니다 (싱글톤 패턴)"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = FHIROutbox()
+    return _outbox
@@ -0,0 +1,189 @@
+import re
+import sys
+import json
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ==================================================================
+# 로컬 FHIR 테스트 서버 (메모리 저장, 개발/부하 시험용)
+# 실제 FHIR 서버 없이 fhir_sync.py / fhir_client.py / fhir_outbox.py를 시험할 때 사용합니다.
+#   POST   /Patient              생성 (If-None-Exist 조건부 생성)
+#   GET    /Patient/{id}         조회 (ETag, If-None-Match -> 304)
+#   DELETE /Patient/{id}         삭제
+#   GET    /Patient?_count=N     페이지 검색 (next 링크)
+#   POST   /                     batch / transaction Bundle
+#   GET    /Patient/$export      Bulk Data 비동기 내보내기 (NDJSON)
+#
+# 사용법: python fhir_stub.py --port 8090 --patients 10000
+#         (서버 주소: fhir_sync.py --url http://127.0.0.1:8090 또는 config.FHIR_SERVER_URL 변경)
+# ==================================================================
+class PatientStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._patients = {}
+        self._versions = {}
+        self._next_id = 1
+
+    def create(self, resource, condition=None):
+        """(ID, 새로 만들었는지)를 반환합니다. condition은 'identifier=system|value' 형식."""
+        with self._lock:
+            if condition:
+                found = self._find_identifier(condition.partition('=')[2])
+                if found:
+                    return found, False
+            pid = str(self._next_id)
+            self._next_id += 1
+            self._patients[pid] = dict(resource, resourceType="Patient", id=pid)
+            self._versions[pid] = 1
+            return pid, True
+
+    def _find_identifier(self, token):
+        system, _, value = token.rpartition('|')
+        for pid, res in self._patients.items():
+            for ident in res.get('identifier', []):
+                if ident.get('value') == value and (not system or ident.get('system') == system):
+                    return pid
+        return None
+
+    def get(self, pid):
+        with self._lock:
+            res = self._patients.get(pid)
+            return (res, self._versions[pid]) if res else (None, None)
+
+    def delete(self, pid):
+        with self._lock:
+            self._versions.pop(pid, None)
+            return self._patients.pop(pid, None) is not None
+
+    def page(self, offset, count):
+        with self._lock:
+            ids = sorted(self._patients, key=int)
+            return [self._patients[pid] for pid in ids[offset:offset + count]], len(ids)
+
+    def all(self):
+        with self._lock:
+            return list(self._patients.values())
+
+store = PatientStore()
+
+class FHIRStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 헤더와 본문을 따로 보내므로 Nagle 알고리즘을 끄지 않으면 keep-alive 요청마다 ~40ms 지연
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _base(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def _send(self, code, body=None, headers=None, content_type='application/fhir+json'):
+        data = b'' if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode('utf-8'))
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    # ---------------- 리소스 처리 (Bundle 항목에서도 재사용) ----------------
+    def _handle(self, method, path, resource=None, condition=None):
+        """(상태 코드, 본문, 헤더)를 반환합니다."""
+        m = re.fullmatch(r'/?Patient(?:/([^/?]+))?', path)
+        if not m:
+            return 404, None, {}
+        pid = m.group(1)
+        if method == 'POST' and pid is None:
+            pid, created = store.create(resource or {}, condition)
+            res, version = store.get(pid)
+            return (201 if created else 200), res, {'Location': f"Patient/{pid}/_history/{version}",
+                                                   'ETag': f'W/"{version}"'}
+        if method == 'GET' and pid:
+            res, version = store.get(pid)
+            if res is None:
+                return 404, None, {}
+            return 200, res, {'ETag': f'W/"{version}"'}
+        if method == 'DELETE' and pid:
+            return (204 if store.delete(pid) else 404), None, {}
+        return 405, None, {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/Patient':
+            offset = int(query.get('_getpagesoffset', ['0'])[0])
+            count = int(query.get('_count', ['50'])[0])
+            page, total = store.page(offset, count)
+            bundle = {"resourceType": "Bundle", "type": "searchset", "total": total,
+                      "entry": [{"resource": res} for res in page], "link": []}
+            if offset + count < total:
+                bundle["link"].append({"relation": "next",
+                                       "url": f"{self._base()}/Patient?_count={count}&_getpagesoffset={offset + count}"})
+            return self._send(200, bundle)
+        if url.path == '/Patient/$export':
+            # 내보내기는 즉시 끝난 것으로 처리
+            return self._send(202, headers={'Content-Location': f"{self._base()}/$export-status"})
+        if url.path == '/$export-status':
+            return self._send(200, {"output": [{"type": "Patient", "url": f"{self._base()}/$export-file/Patient.ndjson"}]},
+                              content_type='application/json')
+        if url.path == '/$export-file/Patient.ndjson':
+            data = ''.join(json.dumps(res) + '\n' for res in store.all()).encode('utf-8')
+            return self._send(200, data, content_type='application/fhir+ndjson')
+
+        code, body, headers = self._handle('GET', url.path)
+        if code == 200 and self.headers.get('If-None-Match') == headers.get('ETag'):
+            return self._send(304, headers=headers)
+        self._send(code, body, headers)
+
+    def do_DELETE(self):
+        code, body, headers = self._handle('DELETE', urlparse(self.path).path)
+        self._send(code, body, headers)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if path.rstrip('/') == '':
+            return self._bundle(body)
+        code, res, headers = self._handle('POST', path, body, self.headers.get('If-None-Exist'))
+        self._send(code, res, headers)
+
+    def _bundle(self, bundle):
+        if bundle.get('resourceType') != 'Bundle' or bundle.get('type') not in ('batch', 'transaction'):
+            return self._send(400, {"resourceType": "OperationOutcome"})
+        entries = []
+        for entry in bundle.get('entry', []):
+            req = entry.get('request', {})
+            code, res, headers = self._handle(req.get('method', 'GET'), req.get('url', ''),
+                                              entry.get('resource'), req.get('ifNoneExist'))
+            response = {"status": f"{code}"}
+            if 'Location' in headers:
+                response["location"] = headers['Location']
+            entries.append({"response": response, **({"resource": res} if res else {})})
+        self._send(200, {"resourceType": "Bundle", "type": f"{bundle['type']}-response", "entry": entries})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="로컬 FHIR 테스트 서버")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--patients', type=int, default=0, help="미리 만들어 둘 환자 수")
+    args = parser.parse_args(argv)
+
+    for i in range(args.patients):
+        store.create({"name": [{"use": "official", "family": f"Test{i}", "given": ["NFN"]}]})
+    server = ThreadingHTTPServer((args.host, args.port), FHIRStubHandler)
+    print(f"[STUB] FHIR 테스트 서버 시작: http://{args.host}:{args.port} (환자 {args.patients}명)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
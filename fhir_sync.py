@@ -0,0 +1,210 @@
+import sys
+import json
+import time
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import FHIR_SERVER_URL, FHIR_SYNC_WORKERS, FHIR_SYNC_BATCH_SIZE
+import db_manager
+from fhir_client import FHIRClient
+
+# ==================================================================
+# [최적화] FHIR 대량 동기화 도구 (삭제 / 가져오기)
+# Fhir_delete.py처럼 환자를 1명씩 새 연결로 지우지 않고,
+#   delete : batch Bundle(DELETE 여러 건을 요청 1회로) 또는 작업자 풀 + keep-alive 연결로 삭제
+#   import : $export NDJSON / NDJSON 파일 / 페이지 검색 결과를 스트리밍으로 읽어
+#            MySQL patients 테이블에 executemany로 묶어서 등록
+# 처리 건수와 초당 처리량을 출력합니다.
+#
+# 사용법:
+#   python fhir_sync.py delete 1 2 3            (또는 --ids-file ids.txt)
+#   python fhir_sync.py import                  (Patient 페이지 검색)
+#   python fhir_sync.py import --export         ($export 비동기 NDJSON)
+#   python fhir_sync.py import --ndjson patients.ndjson
+# 공통 옵션: --url FHIR 서버 주소, --workers 동시 요청 수, --batch 묶음 크기
+# ==================================================================
+_UNSUPPORTED = (404, 405, 501)
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _report(label, count, started):
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"📊 {label}: {count}건, {elapsed:.2f}초 ({rate:.1f}건/초)")
+    return {"count": count, "seconds": round(elapsed, 3), "per_sec": round(rate, 1)}
+
+# ---------------- 삭제 ----------------
+def _delete_bundle(client, ids):
+    """batch Bundle 1개로 삭제합니다. {ID: 상태 코드} 또는 None(미지원 서버)."""
+    bundle = {"resourceType": "Bundle", "type": "batch", "entry": [
+        {"request": {"method": "DELETE", "url": f"Patient/{pid}"}} for pid in ids]}
+    r = client.post("", json=bundle)
+    if r.status_code in _UNSUPPORTED:
+        return None
+    r.raise_for_status()
+    results = {}
+    for pid, entry in zip(ids, r.json().get('entry', [])):
+        status = entry.get('response', {}).get('status', '')
+        results[pid] = int(status.split()[0]) if status[:3].isdigit() else 0
+    return results
+
+def _delete_one(client, pid):
+    try:
+        return pid, client.delete(f"/Patient/{pid}").status_code
+    except Exception as e:
+        print(f"❌ ID {pid} 삭제 요청 실패: {e}")
+        return pid, 0
+
+def bulk_delete(client, ids, workers=FHIR_SYNC_WORKERS, batch_size=FHIR_SYNC_BATCH_SIZE):
+    """FHIR 서버에서 환자들을 삭제하고 {'deleted', 'missing', 'failed', ...} 통계를 반환합니다."""
+    started = time.perf_counter()
+    results = {}
+    use_bundle = True
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fhir-delete") as pool:
+        for chunk in _chunks(ids, batch_size):
+            if use_bundle:
+                try:
+                    chunk_results = _delete_bundle(client, chunk)
+                except Exception as e:
+                    print(f"⚠️ batch Bundle 삭제 실패 ({e})")
+                    chunk_results = None
+                if chunk_results is not None:
+                    results.update(chunk_results)
+                    continue
+                use_bundle = False
+                print("[SYNC] batch Bundle을 쓸 수 없어 작업자 풀로 1건씩 삭제합니다.")
+            results.update(pool.map(lambda pid: _delete_one(client, pid), chunk))
+
+    # 200(성공) 또는 204(삭제됨/내용없음)면 성공, 404/410은 이미 없음
+    deleted = [pid for pid, code in results.items() if code in (200, 204)]
+    missing = [pid for pid, code in results.items() if code in (404, 410)]
+    failed = [pid for pid, code in results.items() if code not in (200, 204, 404, 410)]
+    stats = _report("FHIR 삭제", len(results), started)
+    print(f"   ✅ 삭제 {len(deleted)}건 / ⚠️ 없음 {len(missing)}건 / ❌ 실패 {len(failed)}건")
+    if failed:
+        print(f"   실패 ID: {failed[:20]}{' ...' if len(failed) > 20 else ''}")
+    return {**stats, "deleted": deleted, "missing": missing, "failed": failed}
+
+# ---------------- 가져오기 ----------------
+def iter_ndjson_lines(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_search(client, page_size):
+    """Patient 검색 결과를 페이지(next 링크)를 따라가며 하나씩 돌려줍니다."""
+    r = client.get("/Patient", params={"_count": page_size, "_elements": "id"})
+    while True:
+        r.raise_for_status()
+        bundle = r.json()
+        for entry in bundle.get('entry', []):
+            yield entry.get('resource', {})
+        next_url = next((link['url'] for link in bundle.get('link', []) if link.get('relation') == 'next'), None)
+        if not next_url:
+            return
+        r = client.session.get(next_url, timeout=client.timeout)
+
+def iter_export(client, poll_interval=1.0):
+    """Bulk Data $export(비동기)로 만든 Patient NDJSON 파일들을 스트리밍으로 읽습니다."""
+    r = client.get("/Patient/$export", params={"_type": "Patient"},
+                   headers={"Accept": "application/fhir+json", "Prefer": "respond-async"})
+    if r.status_code != 202:
+        raise RuntimeError(f"$export 시작 실패: {r.status_code}")
+    status_url = r.headers['Content-Location']
+    while True:
+        r = client.session.get(status_url, timeout=client.timeout)
+        if r.status_code == 202:
+            time.sleep(float(r.headers.get('Retry-After', poll_interval)))
+            continue
+        r.raise_for_status()
+        break
+    for output in r.json().get('output', []):
+        if output.get('type') != 'Patient':
+            continue
+        with client.session.get(output['url'], stream=True, timeout=client.timeout) as part:
+            part.raise_for_status()
+            yield from iter_ndjson_lines(part.iter_lines())
+
+def import_patients(resources, batch_size=FHIR_SYNC_BATCH_SIZE):
+    """Patient 리소스들을 patients 테이블에 묶음 단위 UPSERT로 등록합니다."""
+    conn, cursor = db_manager.get_db_connection()
+    if not conn:
+        print("❌ DB 연결 실패")
+        return None
+    started = time.perf_counter()
+    total = 0
+    sql = """
+        INSERT INTO patients (id, last_updated)
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE last_updated = VALUES(last_updated)
+    """
+    try:
+        ids = (res.get('id') for res in resources if res.get('resourceType', 'Patient') == 'Patient')
+        for chunk in _chunks((pid for pid in ids if pid), batch_size):
+            now = datetime.datetime.now()
+            cursor.executemany(sql, [(pid, now) for pid in chunk])
+            conn.commit()
+            total += len(chunk)
+            print(f"   ... {total}건 등록")
+    finally:
+        cursor.close()
+        conn.close()
+    return _report("patients 테이블 등록", total, started)
+
+def _read_ids(args):
+    ids = list(args.ids)
+    if args.ids_file:
+        with open(args.ids_file, 'r', encoding='utf-8') as f:
+            ids.extend(line.strip() for line in f if line.strip())
+    return list(dict.fromkeys(str(pid) for pid in ids))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FHIR 대량 동기화 도구 (삭제 / 가져오기)")
+    parser.add_argument('--url', default=FHIR_SERVER_URL, help="FHIR 서버 주소")
+    parser.add_argument('--workers', type=int, default=FHIR_SYNC_WORKERS, help="동시 요청 수")
+    parser.add_argument('--batch', type=int, default=FHIR_SYNC_BATCH_SIZE, help="Bundle / DB 묶음 크기")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_delete = sub.add_parser('delete', help="FHIR 서버에서 환자 삭제")
+    p_delete.add_argument('ids', nargs='*', help="삭제할 환자 ID")
+    p_delete.add_argument('--ids-file', help="환자 ID 목록 파일 (한 줄에 1개)")
+
+    p_import = sub.add_parser('import', help="FHIR 환자를 로컬 patients 테이블로 가져오기")
+    source = p_import.add_mutually_exclusive_group()
+    source.add_argument('--ndjson', help="Patient NDJSON 파일 ('-'는 표준 입력)")
+    source.add_argument('--export', action='store_true', help="$export 비동기 NDJSON 사용")
+
+    args = parser.parse_args(argv)
+    client = FHIRClient(base_url=args.url, pool_size=args.workers, max_concurrent=args.workers)
+
+    if args.command == 'delete':
+        ids = _read_ids(args)
+        if not ids:
+            print("ℹ️ 삭제할 ID가 입력되지 않았습니다.")
+            return 1
+        result = bulk_delete(client, ids, args.workers, args.batch)
+        return 1 if result["failed"] else 0
+
+    if args.ndjson == '-':
+        resources = iter_ndjson_lines(sys.stdin)
+    elif args.ndjson:
+        resources = iter_ndjson_lines(open(args.ndjson, 'r', encoding='utf-8'))
+    elif args.export:
+        resources = iter_export(client)
+    else:
+        resources = iter_search(client, args.batch)
+    return 0 if import_patients(resources, args.batch) is not None else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
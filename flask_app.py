@@ -1,10 +1,19 @@
+import os
 from flask import Flask
 from routes import init_routes 
+from identify_stream import init_stream_routes
+from fhir_outbox import get_fhir_outbox
 
 app = Flask(__name__, template_folder='templates')
 app.secret_key = 'secret'
 
 init_routes(app) 
+init_stream_routes(app)
+
+# 재시작 전에 못 보낸 FHIR 환자 생성 요청을 이어서 전송
+# (debug 재시작기의 감시 프로세스는 요청을 받지 않으므로 실제 서버 프로세스에서만 시작)
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    get_fhir_outbox().start()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
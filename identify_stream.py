@@ -0,0 +1,62 @@
+import json
+import base64
+from config import STREAM_MAX_FRAME_BYTES
+from face_recognizer import identify_image
+from sessions import identify_sessions
+from vision_pool import get_vision_pool, VisionBusy, PRIORITY_IDENTIFY
+
+try:
+    from flask_sock import Sock
+except ImportError:  # flask-sock 미설치 시 HTTP 폴링(/identify_face)만 사용
+    Sock = None
+
+# ==================================================================
+# [최적화] WebSocket 스트리밍 식별 (/ws/identify)
+# 500ms마다 새 HTTP 요청을 보내는 대신, 연결 하나로 프레임을 계속 받아 바로 응답합니다.
+#   클라이언트 -> 서버 : JPEG 바이너리 메시지 (또는 {"image": "data:image/jpeg;base64,..."} 텍스트)
+#   서버 -> 클라이언트 : /identify_face와 같은 JSON (첫 메시지는 {"status": "ready", "session_id"})
+#                         작업 풀이 가득 차면 {"status": "busy", "retry_after"} (클라이언트는 그만큼 쉬고 전송)
+# 연결마다 세션(sessions.py)을 만들어 얼굴 위치와 최근 식별 결과를 유지하며,
+# 확실한 결과("status": "ok")가 나오면 그 프레임의 응답으로 바로 전달됩니다.
+# ==================================================================
+
+def _frame_bytes(message):
+    """WebSocket 메시지에서 이미지 바이트를 꺼냅니다."""
+    if isinstance(message, (bytes, bytearray)):
+        return message
+    try:
+        image = json.loads(message).get('image', '')
+    except (ValueError, AttributeError):
+        return None
+    return base64.b64decode(image.partition(',')[2] or image) if image else None
+
+def init_stream_routes(app):
+    if Sock is None:
+        print("[INIT] flask-sock 미설치: WebSocket 스트리밍 식별 비활성화 (HTTP 폴링 사용)")
+        return
+
+    sock = Sock(app)
+
+    @sock.route('/ws/identify')
+    def identify_stream(ws):
+        session = identify_sessions.create()
+        try:
+            ws.send(json.dumps({"status": "ready", "session_id": session.session_id}))
+            while True:
+                message = ws.receive()
+                if message is None:
+                    break
+                frame = _frame_bytes(message)
+                if not frame or len(frame) > STREAM_MAX_FRAME_BYTES:
+                    ws.send(json.dumps({"status": "error", "message": "잘못된 프레임입니다."}))
+                    continue
+                try:
+                    with session.lock:
+                        result = get_vision_pool().run(PRIORITY_IDENTIFY, identify_image, frame, session)
+                except VisionBusy as e:
+                    result = {"status": "busy", "message": str(e), "retry_after": e.retry_after}
+                except Exception as e:
+                    result = {"status": "error", "message": str(e)}
+                ws.send(json.dumps(result))
+        finally:
+            identify_sessions.discard(session.session_id)
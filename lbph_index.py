@@ -0,0 +1,189 @@
+import numpy as np
+
+# ==================================================================
+# [최적화] LBPH 히스토그램 인덱스 (NumPy 벡터 연산 기반 식별 엔진)
+# OpenCV LBPHFaceRecognizer와 같은 방식(radius=1, neighbors=8, grid 8x8)으로
+# 공간 히스토그램을 만들고, 학습 샘플 전체를 하나의 연속된 행렬에 모아
+# 질의 한 번에 모든 샘플과의 거리를 계산합니다.
+# 최근접 1개만 돌려주는 recognizer.predict와 달리 상위 k개 후보를
+# 환자 단위로 묶어서 돌려주므로, 의료진 확인용 후보 목록으로 사용할 수 있습니다.
+# ==================================================================
+RADIUS = 1
+NEIGHBORS = 8
+GRID_X = 8
+GRID_Y = 8
+NUM_PATTERNS = 2 ** NEIGHBORS
+FEATURE_DIM = GRID_X * GRID_Y * NUM_PATTERNS
+
+# 거리 계산 시 한 번에 처리하는 (샘플 수 x 차원) 원소 개수 상한 (임시 메모리를 캐시 크기로 제한)
+_BLOCK_ELEMENTS = 1 << 18
+
+def _neighbor_weights():
+    """원형 이웃 좌표와 쌍선형 보간 가중치를 OpenCV elbp와 동일하게 계산합니다."""
+    params = []
+    for n in range(NEIGHBORS):
+        x = np.float32(RADIUS * np.cos(2.0 * np.pi * n / float(NEIGHBORS)))
+        y = np.float32(-RADIUS * np.sin(2.0 * np.pi * n / float(NEIGHBORS)))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        ty, tx = np.float32(y - fy), np.float32(x - fx)
+        one = np.float32(1)
+        weights = ((one - tx) * (one - ty), tx * (one - ty), (one - tx) * ty, tx * ty)
+        params.append((fx, fy, cx, cy, weights))
+    return params
+
+_NEIGHBOR_PARAMS = _neighbor_weights()
+
+def lbp_image(img):
+    """그레이스케일 얼굴 이미지의 LBP 코드 이미지를 계산합니다. (테두리 RADIUS 픽셀 제외)"""
+    src = np.asarray(img, dtype=np.float32)
+    rows, cols = src.shape
+    r = RADIUS
+    h, w = rows - 2 * r, cols - 2 * r
+    center = src[r:r + h, r:r + w]
+    codes = np.zeros((h, w), dtype=np.int32)
+    for n, (fx, fy, cx, cy, (w1, w2, w3, w4)) in enumerate(_NEIGHBOR_PARAMS):
+        t = (w1 * src[r + fy:r + fy + h, r + fx:r + fx + w]
+             + w2 * src[r + fy:r + fy + h, r + cx:r + cx + w]
+             + w3 * src[r + cy:r + cy + h, r + fx:r + fx + w]
+             + w4 * src[r + cy:r + cy + h, r + cx:r + cx + w])
+        codes |= ((t > center) | (np.abs(t - center) < np.finfo(np.float32).eps)).astype(np.int32) << n
+    return codes
+
+def lbph_histogram(img):
+    """얼굴 이미지 1장의 공간 히스토그램(FEATURE_DIM 차원, float32)을 계산합니다."""
+    codes = lbp_image(img)
+    cell_h, cell_w = codes.shape[0] // GRID_Y, codes.shape[1] // GRID_X
+    if cell_h == 0 or cell_w == 0:
+        raise ValueError(f"얼굴 이미지가 너무 작습니다: {img.shape}")
+    cells = codes[:cell_h * GRID_Y, :cell_w * GRID_X].reshape(GRID_Y, cell_h, GRID_X, cell_w)
+    cells = cells.transpose(0, 2, 1, 3).reshape(GRID_Y * GRID_X, cell_h * cell_w)
+    cell_ids = np.arange(GRID_Y * GRID_X, dtype=np.int64)[:, None] * NUM_PATTERNS
+    hist = np.bincount((cells + cell_ids).ravel(), minlength=FEATURE_DIM).astype(np.float32)
+    hist /= np.float32(cell_h * cell_w)
+    return hist
+
+def lbph_histograms(images):
+    """여러 얼굴 이미지의 히스토그램을 (N, FEATURE_DIM) 행렬로 계산합니다."""
+    out = np.empty((len(images), FEATURE_DIM), dtype=np.float32)
+    for i, img in enumerate(images):
+        out[i] = lbph_histogram(img)
+    return out
+
+class LBPHIndex:
+    def __init__(self, histograms=None, labels=None, metric="chisqr", row_sums=None):
+        if histograms is None:
+            histograms = np.empty((0, FEATURE_DIM), dtype=np.float32)
+            labels = np.empty(0, dtype=np.int32)
+        self.histograms = np.ascontiguousarray(histograms, dtype=np.float32)
+        self.labels = np.ascontiguousarray(labels, dtype=np.int32).ravel()
+        if self.histograms.shape[0] != self.labels.shape[0]:
+            raise ValueError("히스토그램과 라벨 개수가 다릅니다.")
+        if metric not in ("chisqr", "l1"):
+            raise ValueError(f"지원하지 않는 거리: {metric}")
+        self.metric = metric
+        # 모델 파일에 저장된 행 합계가 있으면 그대로 사용 (memmap 전체를 읽지 않기 위해)
+        self._row_sums = None if row_sums is None else np.asarray(row_sums, dtype=np.float32)
+        self._groups = None
+
+    @classmethod
+    def from_recognizer(cls, model, metric="chisqr"):
+        """학습된 cv2 LBPHFaceRecognizer의 히스토그램/라벨을 그대로 옮겨 인덱스를 만듭니다."""
+        hists = model.getHistograms()
+        if not hists:
+            return cls(metric=metric)
+        return cls(np.vstack([h.reshape(1, -1) for h in hists]), model.getLabels(), metric)
+
+    def __len__(self):
+        return self.labels.shape[0]
+
+    @property
+    def row_sums(self):
+        """샘플별 히스토그램 합계 (질의가 0인 구간의 거리 기여분 계산용)"""
+        if self._row_sums is None:
+            self._row_sums = self.histograms.sum(axis=1, dtype=np.float32)
+        return self._row_sums
+
+    def distances(self, queries):
+        """질의 히스토그램 (Q, D)와 모든 샘플 (N, D) 사이의 거리 행렬 (Q, N)을 계산합니다.
+
+        LBPH 히스토그램은 대부분 0이므로 질의가 0이 아닌 구간(support)만 모아서 계산합니다.
+        질의가 0인 구간의 기여분은 chi-square / L1 모두 샘플 값 그 자체이므로
+        (행 합계 - support 구간 합계)로 한 번에 더해줍니다.
+        질의가 여러 개면 샘플 행렬을 블록 단위로 한 번만 훑으면서 모든 질의를 계산하므로,
+        큰 모델(memmap)에서도 행렬을 질의 수만큼 반복해서 읽지 않습니다.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n = len(self)
+        out = np.empty((queries.shape[0], n), dtype=np.float32)
+        supports = [np.flatnonzero(q) for q in queries]
+        qs = [q[s] for q, s in zip(queries, supports)]
+        step = max(1, _BLOCK_ELEMENTS // max(1, max(s.size for s in supports)))
+        eps = np.finfo(np.float32).eps
+        for start in range(0, n, step):
+            stop = min(n, start + step)
+            block = self.histograms[start:stop]
+            block_sums = self.row_sums[start:stop]
+            for i, support in enumerate(supports):
+                hs = block[:, support]
+                outside = block_sums - hs.sum(axis=1)
+                diff = hs - qs[i]
+                if self.metric == "l1":
+                    np.abs(diff, out=diff)
+                    out[i, start:stop] = diff.sum(axis=1) + outside
+                else:
+                    # OpenCV HISTCMP_CHISQR_ALT: sum 2 * (a - b)^2 / (a + b)
+                    # (a + b)가 0인 곳은 (a - b)도 0이므로 분모만 eps로 막아도 결과가 같습니다.
+                    total = hs + qs[i]
+                    np.maximum(total, eps, out=total)
+                    diff *= diff
+                    diff /= total
+                    out[i, start:stop] = 2.0 * (diff.sum(axis=1) + outside)
+        return out
+
+    def _label_groups(self):
+        """라벨별로 샘플을 묶기 위한 (정렬 순서, 그룹 시작 위치, 라벨, 샘플 수)를 준비합니다."""
+        if self._groups is None:
+            order = np.argsort(self.labels, kind="stable")
+            sorted_labels = self.labels[order]
+            starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+            counts = np.diff(np.r_[starts, len(sorted_labels)])
+            self._groups = (order, starts, sorted_labels[starts], counts)
+        return self._groups
+
+    def _candidates(self, dist, k):
+        """샘플별 거리를 환자(라벨) 단위로 묶어 가장 가까운 k명을 반환합니다.
+
+        distance: 해당 환자 샘플 중 최소 거리 (recognizer.predict의 confidence와 같음)
+        score:    해당 환자 샘플 전체의 평균 거리
+        votes:    전체에서 가장 가까운 k개 샘플 중 해당 환자 샘플 수
+        """
+        order, starts, group_labels, counts = self._label_groups()
+        sorted_dist = dist[order]
+        best = np.minimum.reduceat(sorted_dist, starts)
+        mean = np.add.reduceat(sorted_dist, starts) / counts
+
+        k_labels = min(k, len(group_labels))
+        top = np.argpartition(best, k_labels - 1)[:k_labels] if k_labels < len(group_labels) else np.arange(len(group_labels))
+        top = top[np.argsort(best[top], kind="stable")]
+
+        k_samples = min(k, dist.shape[0])
+        nearest = np.argpartition(dist, k_samples - 1)[:k_samples]
+        votes = dict(zip(*np.unique(self.labels[nearest], return_counts=True)))
+
+        return [
+            {"label": int(group_labels[g]), "distance": float(best[g]),
+             "votes": int(votes.get(group_labels[g], 0)), "score": float(mean[g])}
+            for g in top
+        ]
+
+    def query_batch(self, faces, k=5):
+        """얼굴 이미지 여러 장을 한 번에 조회합니다. 각 얼굴마다 후보 목록을 반환합니다."""
+        if len(self) == 0 or not len(faces):
+            return [[] for _ in faces]
+        dist = self.distances(lbph_histograms(faces))
+        return [self._candidates(row, k) for row in dist]
+
+    def query(self, face, k=5):
+        """얼굴 이미지 1장에 대해 가까운 순서의 후보 목록을 반환합니다."""
+        return self.query_batch([face], k)[0]
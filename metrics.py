@@ -0,0 +1,123 @@
+import bisect
+import threading
+import time
+from config import METRICS_ENABLED
+
+# ==================================================================
+# [모니터링] 단계별 처리 시간 히스토그램 + Prometheus 형식 /metrics 출력
+# 요청 처리 중에는 시간 측정값을 버킷 개수에 더하기만 하고(문자열 생성/외부 라이브러리 없음),
+# 텍스트 변환은 /metrics를 읽어갈 때만 합니다. 캐시 적중률 등 기존 get_stats() 값은
+# 읽어갈 때 그대로 가져와 게이지로 내보냅니다.
+#   healid_stage_seconds{stage}            : payload / decode / detect / predict 단계
+#   healid_db_query_seconds{query}         : DB 조회 (라벨 매핑, 환자 확인 등)
+#   healid_db_pool_wait_seconds            : 커넥션 풀 대기 시간
+#   healid_fhir_request_seconds{method,status} : FHIR 서버 요청
+#   healid_http_request_seconds{endpoint,method} : Flask 요청 전체
+#   healid_vision_queue_seconds{priority}  : 영상 처리 작업 풀 대기 시간 (identify / register / train)
+# ==================================================================
+# 지연시간 버킷 (초)
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []          # 히스토그램 (등록 순서대로 출력)
+_stats_sources = []     # (이름, get_stats 함수)
+_registry_lock = threading.Lock()
+
+class _Timer:
+    __slots__ = ('_histogram', '_labels', '_started')
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started, *self._labels)
+        return False
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}       # 라벨 값 tuple -> [버킷별 개수(+Inf 포함), 합계]
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def time(self, *labels):
+        """with 블록의 실행 시간을 기록합니다."""
+        return _Timer(self, labels)
+
+    def collect(self):
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in sorted(snapshot):
+            base = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{{{','.join(base + [le])}}} {cumulative}")
+            suffix = f"{{{','.join(base)}}}" if base else ''
+            lines.append(f"{self.name}_sum{suffix} {total!r}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def register_stats(name, getter):
+    """get_stats() 형태 함수의 숫자 값들을 healid_{name}_{키} 게이지로 내보냅니다."""
+    with _registry_lock:
+        _stats_sources.append((name, getter))
+
+def _collect_stats(name, getter):
+    try:
+        stats = getter()
+    except Exception as e:
+        return [f"# {name}: {e}"]
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue    # 문자열/None 값(상태 설명 등)은 제외
+        metric = f"healid_{name}_{key}"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value!r}")
+    return lines
+
+def render():
+    """Prometheus 텍스트 형식(0.0.4)으로 모든 지표를 만듭니다."""
+    with _registry_lock:
+        histograms, sources = list(_registry), list(_stats_sources)
+    lines = []
+    for histogram in histograms:
+        lines.extend(histogram.collect())
+    for name, getter in sources:
+        lines.extend(_collect_stats(name, getter))
+    return '\n'.join(lines) + '\n'
+
+# ---------------- 공용 지표 ----------------
+stage_seconds = Histogram("healid_stage_seconds", "식별 처리 단계별 소요 시간(초)", ("stage",))
+db_query_seconds = Histogram("healid_db_query_seconds", "DB 조회 소요 시간(초)", ("query",))
+db_pool_wait_seconds = Histogram("healid_db_pool_wait_seconds", "DB 커넥션 풀 대기 시간(초)")
+fhir_request_seconds = Histogram("healid_fhir_request_seconds", "FHIR 서버 요청 소요 시간(초)", ("method", "status"))
+http_request_seconds = Histogram("healid_http_request_seconds", "HTTP 요청 처리 시간(초)", ("endpoint", "method"))
+vision_queue_seconds = Histogram("healid_vision_queue_seconds", "영상 처리 작업 풀 대기 시간(초)", ("priority",))
@@ -0,0 +1,107 @@
+import os
+import sys
+import struct
+import numpy as np
+from config import MODEL_FILE, MODEL_BIN_FILE
+from lbph_index import LBPHIndex, FEATURE_DIM, RADIUS, NEIGHBORS, GRID_X, GRID_Y
+
+# ==================================================================
+# [최적화] 바이너리 모델 파일 (desa.lbph)
+# OpenCV가 쓰는 desa.yml은 모든 히스토그램을 텍스트로 저장하므로 크고 읽기 느립니다.
+# 아래 형식으로 저장하면 헤더만 읽고 나머지는 memmap으로 필요할 때 읽으므로
+# 서버/워커가 수 밀리초 안에 식별 준비를 마칩니다.
+#
+#   [0:64)    헤더  magic 'HEALLBPH', version, dtype, radius, neighbors, grid_x, grid_y, rows, dim
+#   labels    int32[rows]
+#   row_sums  float32[rows]      (거리 계산용 행 합계)
+#   (64바이트 정렬)
+#   matrix    float32[rows, dim] (LBPH 공간 히스토그램)
+# ==================================================================
+MAGIC = b'HEALLBPH'
+VERSION = 1
+DTYPE_FLOAT32 = 1
+HEADER_SIZE = 64
+_HEADER = struct.Struct('<8sHHIIIIQI')
+
+def _align(offset, boundary=64):
+    return (offset + boundary - 1) // boundary * boundary
+
+def _layout(rows):
+    labels_at = HEADER_SIZE
+    sums_at = labels_at + 4 * rows
+    matrix_at = _align(sums_at + 4 * rows)
+    return labels_at, sums_at, matrix_at
+
+def save_model(path, index, keep=None):
+    """식별용 인덱스를 바이너리 모델 파일로 저장합니다. (임시 파일에 쓴 뒤 교체)
+
+    keep(샘플별 bool 배열)이 주어지면 True인 샘플만 저장합니다. (환자 삭제 시 사용)
+    """
+    keep = np.ones(len(index), dtype=bool) if keep is None else np.asarray(keep, dtype=bool)
+    rows = int(keep.sum())
+    labels_at, sums_at, matrix_at = _layout(rows)
+    header = _HEADER.pack(MAGIC, VERSION, DTYPE_FLOAT32, RADIUS, NEIGHBORS, GRID_X, GRID_Y, rows, FEATURE_DIM)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        f.write(np.ascontiguousarray(index.labels[keep], dtype='<i4').tobytes())
+        f.write(np.ascontiguousarray(index.row_sums[keep], dtype='<f4').tobytes())
+        f.write(b'\0' * (matrix_at - f.tell()))
+        # 큰 행렬은 나눠서 기록 (memmap 기반 인덱스도 메모리에 한꺼번에 올리지 않음)
+        for start in range(0, len(index), 1024):
+            chunk = index.histograms[start:start + 1024]
+            chunk_keep = keep[start:start + 1024]
+            if not chunk_keep.all():
+                chunk = chunk[chunk_keep]
+            f.write(np.ascontiguousarray(chunk, dtype='<f4').tobytes())
+    try:
+        os.replace(tmp_path, path)
+    except PermissionError:
+        # Windows에서 현재 서버가 매핑 중인 파일은 교체할 수 없으므로 다음 시작 시 교체
+        os.replace(tmp_path, path + '.new')
+    return rows
+
+def load_model_file(path, metric="chisqr"):
+    """바이너리 모델 파일을 memmap으로 열어 식별용 인덱스를 만듭니다."""
+    if os.path.exists(path + '.new'):
+        os.replace(path + '.new', path)
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < _HEADER.size:
+        raise ValueError("모델 파일 헤더가 손상되었습니다.")
+    magic, version, dtype, radius, neighbors, grid_x, grid_y, rows, dim = _HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise ValueError("Heal ID 모델 파일이 아닙니다.")
+    if version != VERSION or dtype != DTYPE_FLOAT32:
+        raise ValueError(f"지원하지 않는 모델 버전입니다: v{version} dtype={dtype}")
+    if (radius, neighbors, grid_x, grid_y, dim) != (RADIUS, NEIGHBORS, GRID_X, GRID_Y, FEATURE_DIM):
+        raise ValueError("LBPH 파라미터가 현재 설정과 다릅니다. 재학습이 필요합니다.")
+    if rows == 0:
+        return LBPHIndex(metric=metric)
+
+    labels_at, sums_at, matrix_at = _layout(rows)
+    labels = np.fromfile(path, dtype='<i4', count=rows, offset=labels_at)
+    row_sums = np.fromfile(path, dtype='<f4', count=rows, offset=sums_at)
+    matrix = np.memmap(path, dtype='<f4', mode='r', offset=matrix_at, shape=(rows, dim))
+    return LBPHIndex(matrix, labels, metric, row_sums=row_sums)
+
+def convert_yaml(yml_path=MODEL_FILE, out_path=MODEL_BIN_FILE):
+    """OpenCV LBPH 모델(desa.yml)을 바이너리 모델 파일로 변환합니다."""
+    import cv2
+    model = cv2.face.LBPHFaceRecognizer_create()
+    model.read(yml_path)
+    if (model.getRadius(), model.getNeighbors(), model.getGridX(), model.getGridY()) != (RADIUS, NEIGHBORS, GRID_X, GRID_Y):
+        raise ValueError("기본값이 아닌 LBPH 파라미터로 학습된 모델은 변환할 수 없습니다.")
+    rows = save_model(out_path, LBPHIndex.from_recognizer(model))
+    print(f"✅ 모델 변환 완료: {yml_path} -> {out_path} ({rows}개 샘플)")
+    return rows
+
+if __name__ == "__main__":
+    # 사용법: python model_io.py [desa.yml 경로] [desa.lbph 경로]
+    src = sys.argv[1] if len(sys.argv) > 1 else MODEL_FILE
+    dst = sys.argv[2] if len(sys.argv) > 2 else MODEL_BIN_FILE
+    if not os.path.exists(src):
+        print(f"❌ 변환할 모델 파일이 없습니다: {src}")
+        sys.exit(1)
+    convert_yaml(src, dst)
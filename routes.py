@@ -1,29 +1,59 @@
-import os
-import requests
 import base64
+import hmac
 import json
 import datetime
+import time
 import cv2
-from flask import request, jsonify, send_from_directory, render_template
+from flask import request, jsonify, render_template, g, Response
 
-from config import FHIR_SERVER_URL, FACES_DIR 
-from db_manager import register_or_update_patient, check_patient_exists, send_to_fhir_server
-from face_recognizer import train_model_process, recognize_face, detect_and_crop_face
+from config import FHIR_SERVER_URL, BATCH_MAX_FRAMES, FHIR_WRITE_BEHIND, FACE_THUMB_MAX_AGE, ADMIN_TOKEN
+from db_manager import (register_or_update_patient, ensure_patient_registered, check_patient_exists,
+                        send_to_fhir_server, get_patient_cache_stats, get_pool_stats)
+from face_recognizer import detect_and_crop_face, identify_image, identify_faces_image, identify_frames, face_detector
+from sessions import identify_sessions
+from fhir_client import patient_cache, get_fhir_client, FHIRUnavailable
+from fhir_outbox import get_fhir_outbox
+from face_store import get_face_index, get_face_thumbnail, get_thumbnail_stats
+from training_job import start_training, get_training_status
+from data_delete import delete_patients
+from vision_pool import get_vision_pool, VisionBusy, PRIORITY_IDENTIFY, PRIORITY_REGISTER
+import metrics
 
 # ====================================================
-# [유틸] 이미지 저장 함수
+# [유틸] 이미지 인코딩 함수 (얼굴 이미지는 묶음 저장소에 JPEG 바이트로 저장)
 # ====================================================
-def imwrite_safe(path, img):
+def encode_jpeg(img):
     try:
         result, encoded_img = cv2.imencode('.jpg', img)
-        if result:
-            with open(path, mode='wb') as f:
-                encoded_img.tofile(f)
-            return True
-        return False
+        return encoded_img.tobytes() if result else None
     except Exception as e:
         print(f"❌ 저장 실패: {e}")
-        return False
+        return None
+
+def crop_face_jpeg(image_data):
+    """등록용: 이미지에서 얼굴을 잘라 JPEG 바이트로 반환합니다. (얼굴이 없으면 None)"""
+    face, _ = detect_and_crop_face(image_data)
+    return encode_jpeg(face) if face is not None else None
+
+# ====================================================
+# [보안] 관리용 API 접근 확인
+# ====================================================
+_LOCAL_ADDRS = ('127.0.0.1', '::1')
+
+def is_admin_request():
+    """서버 PC에서 온 요청이거나, 설정된 관리 토큰(X-Admin-Token)이 맞으면 True"""
+    if request.remote_addr in _LOCAL_ADDRS:
+        return True
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+# ====================================================
+# [유틸] 과부하 응답 (영상 처리 작업 풀이 가득 찬 경우)
+# ====================================================
+def busy_response(e):
+    """503 + Retry-After로 응답합니다. (클라이언트는 retry_after초 뒤에 다시 요청)"""
+    body = jsonify({"status": "busy", "message": str(e), "retry_after": e.retry_after})
+    return body, 503, {'Retry-After': str(e.retry_after)}
 
 # ====================================================
 # [유틸] 전각 숫자를 반각 숫자로 변환
@@ -34,6 +64,18 @@ def normalize_patient_id(pid):
         return pid
     return str(pid).translate(str.maketrans('０１２３４５６７８９', '0123456789')).strip()
 
+def resolve_patient_id(pid):
+    """임시 로컬 ID(FHIR 전송 대기)에 FHIR ID가 부여되었으면 FHIR ID로 바꿔 반환합니다."""
+    return get_fhir_outbox().resolve(pid) or pid
+
+def fetch_patient_resource(pid, **kwargs):
+    """Patient 리소스를 (상태 코드, JSON 본문 bytes)로 가져옵니다. (전송 대기 중이면 로컬 사본)"""
+    pending = get_fhir_outbox().pending_resource(pid)
+    if pending is not None:
+        return 200, json.dumps(pending, ensure_ascii=False).encode('utf-8')
+    with metrics.stage_seconds.time("fhir_patient"):
+        return patient_cache.fetch(pid, **kwargs)
+
 # ====================================================
 # [유틸] FHIR 환자 이름 추출 함수
 # ====================================================
@@ -60,23 +102,94 @@ def extract_patient_name(fhir_data):
     
     return "Unknown"
 
+# ====================================================
+# [유틸] 요청에서 이미지 꺼내기
+# ====================================================
+def read_image_payload():
+    """요청 본문에서 (이미지 바이트, 부가 필드 dict)를 꺼냅니다.
+
+    - image/jpeg 등 raw 바디: 본문 그대로 사용, 필드는 쿼리스트링 (?id=...)
+    - multipart/form-data: 'image' 파일 파트, 필드는 폼 값
+    - JSON (기존 클라이언트): {"image": "data:image/jpeg;base64,...", ...}
+    """
+    content_type = request.mimetype or ''
+
+    if content_type.startswith('image/') or content_type == 'application/octet-stream':
+        # [최적화] base64/JSON 변환 없이 본문 버퍼를 그대로 디코딩에 사용
+        return request.get_data(cache=False), request.args.to_dict()
+
+    if content_type == 'multipart/form-data':
+        upload = request.files.get('image')
+        fields = request.args.to_dict()
+        fields.update(request.form.to_dict())
+        return (upload.read() if upload else None), fields
+
+    with metrics.stage_seconds.time("payload"):
+        d = request.get_json(silent=True) or {}
+        image = d.get('image')
+        if not image:
+            return None, d
+        return base64.b64decode(image.partition(',')[2] or image), d
+
 # ====================================================
 # [Flask 라우트 정의]
 # ====================================================
+def read_image_payloads():
+    """요청 본문에서 (이미지 바이트 목록, 부가 필드 dict)를 꺼냅니다. (다중 프레임용)
+
+    - multipart/form-data: 'image' 파일 파트 여러 개
+    - JSON: {"images": ["data:image/jpeg;base64,...", ...], ...}
+    """
+    if request.mimetype == 'multipart/form-data':
+        fields = request.args.to_dict()
+        fields.update(request.form.to_dict())
+        return [f.read() for f in request.files.getlist('image')], fields
+
+    with metrics.stage_seconds.time("payload"):
+        d = request.get_json(silent=True) or {}
+        images = d.get('images') or []
+        return [base64.b64decode(image.partition(',')[2] or image) for image in images if image], d
+
 def init_routes(app):
-    
+
+    # [모니터링] 요청 처리 시간 (WebSocket 연결은 수명이 길어 제외, 프레임 단계별 시간은 따로 기록됨)
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.teardown_request
+    def record_request_time(exc):
+        started = g.pop('request_started', None)
+        if started is None or request.headers.get('Upgrade', '').lower() == 'websocket':
+            return
+        rule = request.url_rule
+        metrics.http_request_seconds.observe(time.perf_counter() - started,
+                                             rule.rule if rule else 'unmatched', request.method)
+
+    # /metrics에 캐시/연결 현황도 함께 내보냄 (/cache_stats와 같은 값)
+    metrics.register_stats("fhir_client", lambda: get_fhir_client().get_stats())
+    metrics.register_stats("fhir_patient_cache", patient_cache.get_stats)
+    metrics.register_stats("patient_exists_cache", get_patient_cache_stats)
+    metrics.register_stats("fhir_outbox", lambda: get_fhir_outbox().get_stats())
+    metrics.register_stats("db_pool", get_pool_stats)
+    metrics.register_stats("identify_sessions", identify_sessions.get_stats)
+    metrics.register_stats("face_thumbnails", get_thumbnail_stats)
+    metrics.register_stats("vision_pool", lambda: get_vision_pool().get_stats())
+    metrics.register_stats("face_detector", face_detector.get_stats)
+
     @app.route('/')
     def index():
         return render_template('index.html')
 
     @app.route('/view/patient/<int:pid>')
     def view_patient_from_fhir(pid):
+        pid = resolve_patient_id(pid)
         return render_template('patient_view.html', pid=pid, target_url=f"{FHIR_SERVER_URL}/Patient/{pid}")
 
     @app.route('/check_patient_id', methods=['POST'])
     def check_patient_id_route():
         try:
-            pid = normalize_patient_id(request.json.get('patient_id', ''))
+            pid = resolve_patient_id(normalize_patient_id(request.json.get('patient_id', '')))
             
             if not pid:
                 return jsonify({"status": "error", "exists": False, "message": "ID가 입력되지 않았습니다."})
@@ -87,9 +200,9 @@ def init_routes(app):
             # 1. 로컬 DB에 존재하면 FHIR에서 이름 가져오기
             if exists:
                 try:
-                    r = requests.get(f"{FHIR_SERVER_URL}/Patient/{pid}", timeout=3)
-                    if r.status_code == 200:
-                        fhir_data = r.json()
+                    status, body = fetch_patient_resource(pid, timeout=3)
+                    if status == 200:
+                        fhir_data = json.loads(body)
                         name = extract_patient_name(fhir_data)
                         print(f"[DEBUG] 환자 {pid} 이름: {name}")
                 except Exception as e:
@@ -105,11 +218,11 @@ def init_routes(app):
 
             # 2. 로컬 DB에 없으면 FHIR 서버에 조회
             try:
-                r = requests.get(f"{FHIR_SERVER_URL}/Patient/{pid}", timeout=3)
-                if r.status_code == 200:
+                status, body = fetch_patient_resource(pid, timeout=3)
+                if status == 200:
                     # FHIR 서버에 존재하면, 로컬 DB에 자동 등록하고 성공 처리
                     register_or_update_patient(pid)
-                    fhir_data = r.json()
+                    fhir_data = json.loads(body)
                     name = extract_patient_name(fhir_data)
                     print(f"[DEBUG] 신규 등록 환자 {pid} 이름: {name}")
                     
@@ -156,10 +269,17 @@ def init_routes(app):
             add_ext("medication-summary", data.get('medications'))
             add_ext("condition-summary", data.get('diagnosis'))
 
+            if FHIR_WRITE_BEHIND:
+                # [최적화] FHIR 서버 응답을 기다리지 않고 임시 로컬 ID로 바로 등록 (백그라운드 전송 후 ID 교체)
+                pid = get_fhir_outbox().enqueue(fhir_template)
+                register_or_update_patient(pid)
+                return jsonify({"status": "success", "patient_id": pid, "provisional": True})
+
             success, result = send_to_fhir_server(fhir_template)
             
             if success:
                 pid = result.get('id')
+                patient_cache.invalidate(pid)
                 register_or_update_patient(pid)
                 return jsonify({"status": "success", "patient_id": pid})
             
@@ -170,64 +290,139 @@ def init_routes(app):
     @app.route('/api/proxy/patient/<pid>')
     def proxy_patient_data(pid):
         try:
-            r = requests.get(f"{FHIR_SERVER_URL}/Patient/{pid}", timeout=5)
-            return (r.content, r.status_code, {'Content-Type': 'application/json'})
+            # [최적화] /check_patient_id에서 가져온 리소스를 캐시에서 재사용
+            status, body = fetch_patient_resource(resolve_patient_id(pid))
+            return (body, status, {'Content-Type': 'application/json'})
+        except FHIRUnavailable: return jsonify({"error": "FHIR Server Unavailable"}), 503
         except: return jsonify({"error": "FHIR Server Error"}), 500
 
     @app.route('/register_face', methods=['POST'])
     def register_face_route():
         try:
-            d = request.json
-            img_data = base64.b64decode(d['image'].split(',')[1])
-            pid = normalize_patient_id(d.get('id'))
-            register_or_update_patient(pid)
-            face, _ = detect_and_crop_face(img_data)
-            if face is not None:
-                os.makedirs(FACES_DIR, exist_ok=True)
-                count = len([f for f in os.listdir(FACES_DIR) if f.startswith(f"{pid}_")])
-                save_path = os.path.join(FACES_DIR, f"{pid}_{count}.jpg")
-                imwrite_safe(save_path, face)
+            img_data, d = read_image_payload()
+            if not img_data:
+                return jsonify({"status": "error", "message": "이미지가 없습니다."})
+            pid = resolve_patient_id(normalize_patient_id(d.get('id')))
+            # 연속 촬영 중에는 첫 프레임에서만 DB에 기록 (이후는 캐시 확인만)
+            ensure_patient_registered(pid)
+            # [최적화] 얼굴 검출은 작업 풀에서 식별보다 낮은 우선순위로 실행
+            data = get_vision_pool().run(PRIORITY_REGISTER, crop_face_jpeg, img_data)
+            if data is not None:
+                face_index = get_face_index()
+                face_index.store_image(pid, data)
+                count = face_index.count(pid)
                 return jsonify({"status": "ok", "msg": f"Saved {count}"})
             return jsonify({"status": "fail", "message": "No face"})
+        except VisionBusy as e: return busy_response(e)
         except Exception as e: return jsonify({"status": "error", "message": str(e)})
 
     @app.route('/train_model', methods=['POST'])
     def train_model_route():
-        print("[SERVER] 모델 학습 시작")
-        success, msg = train_model_process()
-        return jsonify({"status": "success" if success else "fail", "message": msg})
+        # {"full": true} 이면 전체 재학습, 기본은 새 이미지만 추가하는 증분 학습
+        full_rebuild = bool((request.get_json(silent=True) or {}).get('full', False))
+        started, status = start_training(full_rebuild=full_rebuild)
+        if started:
+            print(f"[SERVER] 모델 학습 시작 ({'전체' if full_rebuild else '증분'}, 백그라운드)")
+        return jsonify({"status": "started" if started else "running", "job": status}), 202
+
+    @app.route('/train_status')
+    def train_status_route():
+        return jsonify(get_training_status())
 
     @app.route('/identify_face', methods=['POST'])
     def identify_face_route():
         try:
-            d = request.json
-            img_data = base64.b64decode(d['image'].split(',')[1])
-            
-            face_roi, rect = detect_and_crop_face(img_data)
-            
-            if face_roi is None:
-                return jsonify({"status": "searching", "message": "얼굴 탐색 중..."})
-            
-            identified_id, conf = recognize_face(face_roi)
-            
-            if identified_id:
-                return jsonify({
-                    "status": "ok",
-                    "action": "redirect",
-                    "patient_id": identified_id,
-                    "message": f"Found {identified_id}",
-                    "confidence": conf
-                })
-            else:
-                return jsonify({"status": "searching", "message": "Unknown"})
+            img_data, d = read_image_payload()
+            if not img_data:
+                return jsonify({"status": "error", "message": "이미지가 없습니다."})
+
+            # session_id를 보내는 클라이언트는 프레임 간 상태(얼굴 위치 등)를 이어서 사용
+            session = identify_sessions.get(d.get('session_id'))
+            vision = get_vision_pool()
+            if session is None:
+                return jsonify(vision.run(PRIORITY_IDENTIFY, identify_image, img_data))
+            with session.lock:
+                return jsonify(vision.run(PRIORITY_IDENTIFY, identify_image, img_data, session))
+        except VisionBusy as e:
+            return busy_response(e)
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)})
+
+    @app.route('/identify_faces', methods=['POST'])
+    def identify_faces_route():
+        # 프레임 속 모든 얼굴을 한 번에 식별 (얼굴 영역마다 결과 반환)
+        try:
+            img_data, _ = read_image_payload()
+            if not img_data:
+                return jsonify({"status": "error", "message": "이미지가 없습니다."})
+            return jsonify(get_vision_pool().run(PRIORITY_IDENTIFY, identify_faces_image, img_data))
+        except VisionBusy as e:
+            return busy_response(e)
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)})
+
+    @app.route('/identify_batch', methods=['POST'])
+    def identify_batch_route():
+        # 연속 프레임 N장을 한 번에 받아 투표로 환자 1명을 결정 (요청 1회로 식별)
+        try:
+            frames, _ = read_image_payloads()
+            if not frames:
+                return jsonify({"status": "error", "message": "이미지가 없습니다."})
+            if len(frames) > BATCH_MAX_FRAMES:
+                return jsonify({"status": "error", "message": f"프레임은 최대 {BATCH_MAX_FRAMES}장까지 보낼 수 있습니다."}), 400
+            return jsonify(get_vision_pool().run(PRIORITY_IDENTIFY, identify_frames, frames))
+        except VisionBusy as e:
+            return busy_response(e)
         except Exception as e:
             return jsonify({"status": "error", "message": str(e)})
 
+    @app.route('/delete_patients', methods=['POST'])
+    def delete_patients_route():
+        # {"ids": [1, 2, 3]} : DB/얼굴 이미지/모델 샘플을 한 번에 삭제 (재학습 없이 식별 계속 가능)
+        # 되돌릴 수 없는 작업이므로 서버 PC 또는 관리 토큰을 가진 호출만 허용
+        if not is_admin_request():
+            return jsonify({"status": "error", "message": "권한이 없습니다."}), 403
+        ids = [normalize_patient_id(pid) for pid in (request.get_json(silent=True) or {}).get('ids', [])]
+        ids = [pid for pid in ids if pid]
+        if not ids:
+            return jsonify({"status": "error", "message": "삭제할 ID가 없습니다."}), 400
+        try:
+            result = delete_patients(ids)
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+        if "error" in result:
+            return jsonify({"status": "error", "message": result["error"]}), 500
+        return jsonify({"status": "ok", **result})
+
+    @app.route('/cache_stats')
+    def cache_stats_route():
+        # FHIR 연결/캐시 적중 현황 (운영 모니터링용)
+        return jsonify({
+            "fhir_client": get_fhir_client().get_stats(),
+            "fhir_patient_cache": patient_cache.get_stats(),
+            "patient_exists_cache": get_patient_cache_stats(),
+            "fhir_outbox": get_fhir_outbox().get_stats(),
+            "db_pool": get_pool_stats(),
+            "identify_sessions": identify_sessions.get_stats(),
+            "face_thumbnails": get_thumbnail_stats(),
+            "vision_pool": get_vision_pool().get_stats(),
+            "face_detector": face_detector.get_stats(),
+        })
+
+    @app.route('/metrics')
+    def metrics_route():
+        # Prometheus 수집용 (단계별 처리 시간 히스토그램 + 캐시/연결 현황)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
     @app.route('/face_image/<int:pid>')
     def get_face_image(pid):
-        if not os.path.exists(FACES_DIR): return '', 404
-        fs = [f for f in os.listdir(FACES_DIR) if f.startswith(f"{pid}_")]
-        if fs:
-            fs.sort() 
-            return send_from_directory(FACES_DIR, fs[0])
-        return ('', 404)
\ No newline at end of file
+        # [최적화] 축소한 썸네일을 메모리 캐시에서 보내고, ETag가 같으면 304로 본문 생략
+        thumbnail = get_face_thumbnail(resolve_patient_id(pid))
+        if thumbnail is None:
+            return ('', 404)
+        etag, data = thumbnail
+        response = Response(data, mimetype='image/jpeg')
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = FACE_THUMB_MAX_AGE
+        return response.make_conditional(request)
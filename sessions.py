@@ -0,0 +1,138 @@
+import threading
+import time
+import uuid
+from collections import deque
+import cv2
+import numpy as np
+from config import SESSION_TTL, SESSION_HISTORY, FRAME_DEDUP_THRESHOLD, FRAME_DEDUP_MAX_AGE, IDENTITY_HOLD_SECONDS
+
+# ==================================================================
+# 식별 세션 (태블릿/브라우저 1대 = 세션 1개)
+# 연속으로 들어오는 프레임 사이에 유지할 상태(마지막 얼굴 위치, 최근 식별 결과)를 보관합니다.
+# WebSocket 스트림은 연결마다, HTTP 요청은 session_id 값으로 세션을 찾습니다.
+#
+# [최적화] 장면이 그대로인 프레임은 다시 검출/식별하지 않습니다.
+#   - 중복 프레임: 16x16 축소 영상이 직전 처리 프레임과 거의 같으면 직전 결과를 그대로 반환
+#   - 확정 유지: 환자가 확정된 뒤 IDENTITY_HOLD_SECONDS 동안은 같은 얼굴이 추적되면 식별(predict) 생략
+# ==================================================================
+_SIGNATURE_SIZE = 16
+
+def frame_signature(img):
+    """그레이스케일 프레임을 16x16 평균 축소 영상으로 만듭니다. (근사 중복 비교용)"""
+    return cv2.resize(img, (_SIGNATURE_SIZE, _SIGNATURE_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+def _overlap(a, b):
+    """두 영역 (x, y, w, h)의 IoU"""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+class IdentifySession:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.lock = threading.Lock()      # 같은 세션의 프레임은 순서대로 처리
+        self.last_box = None              # 마지막으로 찾은 얼굴 영역 (x, y, w, h)
+        self.recent = deque(maxlen=SESSION_HISTORY)  # 최근 식별 결과 (환자ID 또는 None, 거리)
+        self.frames = 0
+        self.created_at = self.last_seen = time.time()
+        self._signature = None            # 마지막으로 처리한 프레임의 축소 영상
+        self._result = None               # 그 프레임의 응답
+        self._result_at = 0
+        self._confirmed = None            # (확정 응답, 얼굴 영역, 유지 만료 시각)
+
+    def record(self, patient_id, distance):
+        """프레임 1장의 식별 결과를 기록합니다."""
+        self.frames += 1
+        self.last_seen = time.time()
+        self.recent.append((patient_id, distance))
+
+    def cached_result(self, signature):
+        """직전에 처리한 프레임과 거의 같은 프레임이면 그 응답을, 아니면 None을 반환합니다."""
+        if self._signature is None or time.time() - self._result_at > FRAME_DEDUP_MAX_AGE:
+            return None
+        if np.abs(signature - self._signature).mean() >= FRAME_DEDUP_THRESHOLD:
+            return None
+        return dict(self._result, cached=True)
+
+    def remember(self, signature, result):
+        """처리한 프레임의 축소 영상과 응답을 보관합니다. 확정 응답이면 유지 시간을 시작합니다."""
+        now = time.time()
+        self._signature, self._result, self._result_at = signature, result, now
+        if result.get("status") == "ok" and not result.get("held"):
+            self._confirmed = (result, tuple(result["box"]), now + IDENTITY_HOLD_SECONDS)
+
+    def held_result(self, box):
+        """확정 유지 시간 안에 같은 자리의 얼굴이 추적되면 확정 응답을, 아니면 None을 반환합니다."""
+        if self._confirmed is None:
+            return None
+        result, confirmed_box, until = self._confirmed
+        if time.time() > until:
+            self._confirmed = None
+            return None
+        if _overlap(confirmed_box, box) < 0.5:
+            return None
+        return dict(result, box=list(box), held=True)
+
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self._stats = {"frames": 0, "deduplicated": 0, "held": 0}
+
+    def _sweep(self, now):
+        # 오래 쓰지 않은 세션 정리 (TTL의 절반마다 한 번만 전체 확인)
+        if now - self._last_sweep < self.ttl / 2:
+            return
+        self._last_sweep = now
+        expired = [sid for sid, s in self._sessions.items() if now - s.last_seen > self.ttl]
+        for sid in expired:
+            del self._sessions[sid]
+
+    def create(self):
+        """새 세션을 만들어 반환합니다."""
+        session = IdentifySession(uuid.uuid4().hex)
+        with self._lock:
+            self._sweep(time.time())
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id, create=True):
+        """session_id의 세션을 반환합니다. 없으면 같은 ID로 새로 만듭니다. (create=False면 None)"""
+        if not session_id:
+            return None
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            session = self._sessions.get(session_id)
+            if session is None and create:
+                session = IdentifySession(session_id)
+                self._sessions[session_id] = session
+            if session is not None:
+                session.last_seen = now
+            return session
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def count(self, name):
+        """세션 프레임 처리 통계를 1 늘립니다. (frames / deduplicated / held)"""
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self):
+        """활성 세션 수, 프레임 수, 중복으로 건너뛴 프레임 수, 확정 유지로 식별을 생략한 프레임 수"""
+        with self._lock:
+            skipped = self._stats["deduplicated"] + self._stats["held"]
+            return {"sessions": len(self._sessions), **self._stats,
+                    "skip_rate": round(skipped / self._stats["frames"], 3) if self._stats["frames"] else None}
+
+identify_sessions = SessionStore()
@@ -0,0 +1,73 @@
+import threading
+import time
+import face_recognizer
+
+# ==================================================================
+# [최적화] 백그라운드 모델 학습
+# /train_model 요청 스레드에서 바로 학습하지 않고 별도 스레드에서 실행합니다.
+# 학습이 끝나면 face_recognizer.swap_model()로 새 모델이 한 번에 교체되므로
+# 학습 중에도 /identify_face는 기존 모델로 계속 응답합니다.
+# ==================================================================
+_job_lock = threading.Lock()
+_job_thread = None
+_job_status = {
+    "state": "idle",       # idle / running / success / fail
+    "mode": None,          # full / incremental
+    "stage": None,         # scanning / loading / training / saving
+    "done": 0,
+    "total": 0,
+    "rate": None,          # 현재 단계 처리 속도 (장/초)
+    "message": "",
+    "started_at": None,
+    "finished_at": None,
+}
+
+def _update_status(**fields):
+    with _job_lock:
+        _job_status.update(fields)
+
+_stage_started = {}
+
+def _on_progress(stage, done, total):
+    now = time.time()
+    started = _stage_started.setdefault(stage, now)
+    rate = round(done / (now - started), 1) if done and now > started else None
+    _update_status(stage=stage, done=done, total=total, rate=rate)
+
+def _run(full_rebuild):
+    try:
+        success, msg = face_recognizer.train_model_process(full_rebuild=full_rebuild, progress=_on_progress)
+    except Exception as e:
+        success, msg = False, str(e)
+    _update_status(state="success" if success else "fail", message=msg, finished_at=time.time())
+    print(f"[TRAIN] 백그라운드 학습 종료: {msg}")
+
+def get_training_status():
+    """현재(또는 마지막) 학습 작업의 상태를 복사해서 반환합니다."""
+    with _job_lock:
+        status = dict(_job_status)
+    if status["started_at"]:
+        end = status["finished_at"] or time.time()
+        status["elapsed_sec"] = round(end - status["started_at"], 2)
+    return status
+
+def start_training(full_rebuild=False):
+    """학습 작업을 시작합니다. 이미 실행 중이면 새로 시작하지 않습니다.
+
+    (시작 여부, 상태) 튜플을 반환합니다.
+    """
+    global _job_thread
+    with _job_lock:
+        if _job_thread is not None and _job_thread.is_alive():
+            started = False
+        else:
+            _stage_started.clear()
+            _job_status.update(
+                state="running", mode="full" if full_rebuild else "incremental",
+                stage="scanning", done=0, total=0, rate=None, message="",
+                started_at=time.time(), finished_at=None,
+            )
+            _job_thread = threading.Thread(target=_run, args=(full_rebuild,), name="train-model", daemon=True)
+            _job_thread.start()
+            started = True
+    return started, get_training_status()
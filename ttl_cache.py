@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ==================================================================
+# [최적화] 스레드 안전 LRU + TTL 캐시
+# 용량(capacity)을 넘으면 가장 오래 쓰지 않은 항목부터 버리므로 장시간 실행해도 메모리가 일정합니다.
+# 항목마다 만료 시간을 따로 줄 수 있습니다. (예: '없음' 결과는 짧게 보관)
+# ==================================================================
+class TTLCache:
+    def __init__(self, capacity, ttl):
+        self.capacity = max(1, capacity)
+        self.ttl = ttl
+        self._data = OrderedDict()     # key -> (value, 만료 시각)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        """만료되지 않은 값을 반환합니다. 없거나 만료되었으면 default."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.time():
+                self._stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def get_entry(self, key):
+        """만료 여부와 상관없이 (값, 유효 여부)를 반환합니다. 없으면 None. (재검증용)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            fresh = entry[1] > time.time()
+            self._stats["hits" if fresh else "misses"] += 1
+            return entry[0], fresh
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def invalidate_many(self, keys):
+        with self._lock:
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get_stats(self):
+        """항목 수, 용량, 적중/실패/퇴출/무효화 횟수, 적중률을 반환합니다."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {"size": len(self._data), "capacity": self.capacity, **self._stats,
+                    "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None}
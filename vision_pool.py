@@ -0,0 +1,124 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future
+from config import VISION_WORKERS, VISION_QUEUE_LIMIT, VISION_MAX_WAIT
+import metrics
+
+# ==================================================================
+# [최적화] 영상 처리 작업 풀 (우선순위 큐 + 과부하 시 즉시 거절)
+# 디코딩/얼굴 검출/예측을 Flask 요청 스레드에서 바로 실행하지 않고, 작업자 수가 고정된 풀에서 실행합니다.
+# (OpenCV와 NumPy 연산은 GIL을 풀고 실행되므로 프로세스 대신 스레드 사용)
+#   우선순위 : 식별(0) > 등록(1) > 학습(2). 작업자가 비면 대기 중인 가장 높은 우선순위 작업부터 실행
+#   입장 제한 : 내 앞에 대기 중인 작업(같거나 높은 우선순위)이 VISION_QUEUE_LIMIT개 이상이면
+#               기다리지 않고 VisionBusy를 발생 -> 라우트에서 503 + Retry-After로 응답
+#   대기 시한 : VISION_MAX_WAIT초 넘게 기다린 요청 작업은 실행하지 않고 버림 (이미 늦은 응답에 CPU를 쓰지 않음)
+# 학습 작업(shed=False)은 거절/버림 없이 대기하며, 요청 작업이 없을 때만 실행됩니다.
+# ==================================================================
+PRIORITY_IDENTIFY = 0
+PRIORITY_REGISTER = 1
+PRIORITY_TRAIN = 2
+_PRIORITY_NAMES = ("identify", "register", "train")
+
+class VisionBusy(Exception):
+    """작업 대기열이 가득 찼거나 대기 시한을 넘겨 작업을 실행하지 않은 경우"""
+    def __init__(self, retry_after, message="서버가 바쁩니다. 잠시 후 다시 시도하세요."):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class VisionExecutor:
+    def __init__(self, workers=VISION_WORKERS, queue_limit=VISION_QUEUE_LIMIT, max_wait=VISION_MAX_WAIT):
+        self.workers = max(1, workers)
+        self.queue_limit = max(1, queue_limit)
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._heap = []                                 # (우선순위, 순번, 등록 시각, shed, Future, 함수, 인자)
+        self._order = itertools.count()
+        self._queued = [0] * len(_PRIORITY_NAMES)       # 우선순위별 대기 중인 작업 수
+        self._running = 0
+        self._service_time = 0.05                       # 작업 1개 평균 실행 시간(초, 지수 이동 평균)
+        self._threads = []
+        self._stats = {name: {"submitted": 0, "rejected": 0, "expired": 0} for name in _PRIORITY_NAMES}
+
+    def _start(self):
+        # 처음 작업이 들어올 때 작업자 스레드 시작 (학습 전용 프로세스 등에서 불필요한 스레드 방지)
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"vision-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _retry_after(self, ahead):
+        """앞선 작업이 모두 끝날 때까지의 예상 시간(초, 올림, 최소 1)"""
+        return max(1, math.ceil(ahead * self._service_time / self.workers))
+
+    # ---------------- 작업 제출 ----------------
+    def submit(self, priority, fn, *args, shed=True):
+        """작업을 대기열에 넣고 Future를 반환합니다. 대기열이 가득 찼으면 VisionBusy를 발생시킵니다."""
+        name = _PRIORITY_NAMES[priority]
+        future = Future()
+        with self._cond:
+            self._start()
+            if shed:
+                ahead = sum(self._queued[:priority + 1])
+                if ahead >= self.queue_limit:
+                    self._stats[name]["rejected"] += 1
+                    raise VisionBusy(self._retry_after(ahead))
+            self._stats[name]["submitted"] += 1
+            self._queued[priority] += 1
+            heapq.heappush(self._heap, (priority, next(self._order), time.perf_counter(), shed, future, fn, args))
+            self._cond.notify()
+        return future
+
+    def run(self, priority, fn, *args, shed=True):
+        """작업을 풀에서 실행하고 결과를 반환합니다. (요청 스레드는 결과가 나올 때까지 대기)"""
+        return self.submit(priority, fn, *args, shed=shed).result()
+
+    # ---------------- 작업자 ----------------
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                priority, _, queued_at, shed, future, fn, args = heapq.heappop(self._heap)
+                self._queued[priority] -= 1
+                waited = time.perf_counter() - queued_at
+                if shed and waited > self.max_wait:
+                    self._stats[_PRIORITY_NAMES[priority]]["expired"] += 1
+                    future.set_exception(VisionBusy(self._retry_after(sum(self._queued[:priority + 1]))))
+                    continue
+                self._running += 1
+            metrics.vision_queue_seconds.observe(waited, _PRIORITY_NAMES[priority])
+            started = time.perf_counter()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            elapsed = time.perf_counter() - started
+            with self._cond:
+                self._running -= 1
+                self._service_time += 0.1 * (elapsed - self._service_time)
+
+    def get_stats(self):
+        """작업자 수, 대기/실행 중인 작업 수, 우선순위별 제출/거절/시한초과 건수를 반환합니다."""
+        with self._cond:
+            stats = {"workers": self.workers, "queue_limit": self.queue_limit, "running": self._running,
+                     "queued": sum(self._queued), "avg_task_ms": round(self._service_time * 1000, 2)}
+            for name, queued in zip(_PRIORITY_NAMES, self._queued):
+                stats[f"{name}_queued"] = queued
+                for key, value in self._stats[name].items():
+                    stats[f"{name}_{key}"] = value
+            return stats
+
+_vision_pool = None
+_vision_pool_lock = threading.Lock()
+
+def get_vision_pool():
+    """영상 처리 작업 풀을 반환합니다 (싱글톤 패턴)"""
+    global _vision_pool
+    with _vision_pool_lock:
+        if _vision_pool is None:
+            _vision_pool = VisionExecutor()
+    return _vision_pool